@@ -4,26 +4,312 @@
 # Integrated with LongTermMemoryStore and ReAct planning
 # =====================================================
 
-from typing import List, Dict, Any, Optional, Tuple
-from dataclasses import asdict
-from datetime import datetime
+from typing import Callable, List, Dict, Any, Final, Optional, Tuple
+from types import MappingProxyType
+from dataclasses import replace
+from functools import cached_property
+from time import time_ns
+from collections import OrderedDict
+from copy import deepcopy
+from itertools import islice
+from concurrent.futures import Future, ThreadPoolExecutor
+import asyncio
 import logging
-import json
+import re
+import threading
+
+import numpy as np
 
 from app.llm.provider import LLMProvider
+from app.llm.cache import SemanticLLMCache, prompt_hash
 from app.tools.weather import WeatherAdapter
 from app.tools.gmail import GmailAdapter
 from app.tools.vdb import VDBAdapter
 from app.tools.memory import ConversationMemoryAdapter
+from app.memory import similarity
 from app.memory.sqlite_store import SQLiteStore
 from app.agent.intent import Intent, IntentRecognizer
 from app.agent.toolkit import ToolRegistry
 from app.agent.memory import ShortTermMemory, SessionMemory, LongTermMemoryStore
-from app.agent.planning import Step, PlanTrace
+from app.agent.planning import Step, PlanTrace, IntentRun
 from app.guardrails.security_guard import SecurityGuard
+from app.utils.config import settings
+from app.utils.http import get_session, get_httpx_client
+from app.utils import serialization as json
 
 logger = logging.getLogger(__name__)
 
+# JSON object of an LLM reply: either a ```json fenced block or the whole (trimmed) reply
+_JSON_OBJ_RE = re.compile(r"```json\s*(\{.*?\})\s*```|\A\s*(\{.*\})\s*\Z", re.DOTALL)
+
+# intent -> (tool, tool input key, intent slot, default) used when LLM planning fails
+_FALLBACK_ACTIONS: Dict[str, Tuple[Optional[str], str, Optional[str], Any]] = {
+    "get_weather": ("weather", "city", "location", "Singapore"),
+    "summarize_emails": ("gmail", "count", "count", 5),
+    "query_knowledge": ("vdb", "query", "query", ""),
+    "general_qa": (None, "query", "query", ""),
+    "recall_conversation": ("memory", "query", "query", ""),
+}
+
+# intent -> (tool, required slots, optional slots passed through) for single-tool intents
+# whose first step needs no LLM planning once every required slot is filled
+_DIRECT_TOOL_INTENTS: Dict[str, Tuple[str, Tuple[str, ...], Tuple[str, ...]]] = {
+    "get_weather": ("weather", ("location",), ("date", "days_offset")),
+    "summarize_emails": ("gmail", ("count",), ("filter",)),
+    "query_knowledge": ("vdb", ("query",), ("top_k",)),
+}
+
+_EMBEDDING_CACHE_SIZE = 256
+
+# Best knowledge-base score above which potential_knowledge_qa answers from the retrieved chunks
+_RAG_MIN_SCORE = 0.65
+
+# Slot-complete intents whose turn result is never reused: they read state that changes between turns
+_UNCACHED_RESPONSE_INTENTS = frozenset({"summarize_emails"})
+
+# Prompt budgets (characters): LLM latency grows with prompt length, so cap what each round re-sends
+_MAX_OBS_CHARS = 800   # per observation in a planning prompt
+_MAX_SLOT_CHARS = 400  # serialized slots in a planning prompt
+_MAX_CTX_MSGS = 6      # context messages passed to direct QA
+_MAX_CTX_CHARS = 2000  # total content of those messages
+_MAX_MEMORY_CHARS = 600  # per recalled memory merged into that context (three fit the budget)
+_SNIPPET_CHARS = 200   # per search result in an observation
+_SNIPPET_KEYS = 3      # top-level fields serialized for a result without chunk/text
+
+# Fixed clarification replies from intent recognition (read-only templates; callers get a copy)
+_INTENT_CLARIFY_DEFAULT: Final = MappingProxyType({
+    "type": "clarification",
+    "message": "I’m not sure what you mean. Please clarify:",
+    "options": ("Check weather", "Read emails", "Search knowledge base"),
+})
+_INTENT_CLARIFY_ERROR: Final = MappingProxyType({
+    "type": "clarification",
+    "message": "An error occurred while interpreting your request.",
+    "options": ("Retry", "Rephrase"),
+})
+
+
+def _clarification(template: MappingProxyType) -> Dict[str, Any]:
+    """Mutable copy of a clarification template (handle() may rewrite fields, e.g. in secure mode)."""
+    return {**template, "options": list(template["options"])}
+
+
+# Greetings / acknowledgements answered without intent recognition, planning or long-term
+# memory; yes/no are excluded because they usually answer the assistant's previous question
+_CHIT_CHAT_RE = re.compile(
+    r"\s*(hi|hello|hey|thanks|thank you|thx|bye|goodbye|ok|okay)\b[\s!.?,]*",
+    re.IGNORECASE,
+)
+
+# Recall cues (the same ones the rule-based intent fallback uses for memory intents): a query
+# matching one has its long-term memory search started while its intents are being recognized
+_RECALL_CUE_RE = re.compile(
+    r"last time|previous|remember|recall|history|what did i ask|conversation before"
+    r"|(?:search|find)\s+my\s|上次|之前|继续|你还记得",
+    re.IGNORECASE,
+)
+
+# Trivially structured queries whose intent and slots are read off the text without an LLM call:
+# an explicit note ("note: ...", "remember that ...") and a bare weather question for a named place.
+# A note never ends in a question mark ("Remember that restaurant I mentioned?" is a recall request)
+_NOTE_RE = re.compile(
+    r"\s*(?:(?:note|remember|save this)\s*:|(?:note|remember)\s+that\s)\s*(?P<text>\S(?:.*[^?？\s])?)\s*",
+    re.IGNORECASE | re.DOTALL,
+)
+# Words that make a weather question dated ("in June", "in Paris Today"): left to full recognition,
+# which extracts days_offset
+_WEATHER_TIME_WORDS = (
+    r"today|tonight|tomorrow|yesterday|now|morning|afternoon|evening|this|next|last|week|weekend|month"
+    r"|monday|tuesday|wednesday|thursday|friday|saturday|sunday"
+    r"|january|february|march|april|may|june|july|august|september|october|november|december"
+)
+_PLACE_WORD = rf"(?!(?i:{_WEATHER_TIME_WORDS})\b)[A-Z][\w'-]*"
+_WEATHER_IN_RE = re.compile(
+    r"\s*(?i:(?:what(?:'s|’s| is) the )?weather (?:like )?in )"
+    rf"(?P<location>{_PLACE_WORD}(?: {_PLACE_WORD}){{0,2}})\s*[?.!]*\s*"
+)
+
+_CHIT_CHAT_REPLIES: Final = MappingProxyType({
+    "hi": "Hello! How can I help you today?",
+    "hello": "Hello! How can I help you today?",
+    "hey": "Hello! How can I help you today?",
+    "thanks": "You're welcome! Anything else I can help with?",
+    "thank you": "You're welcome! Anything else I can help with?",
+    "thx": "You're welcome! Anything else I can help with?",
+    "bye": "Goodbye! Feel free to come back anytime.",
+    "goodbye": "Goodbye! Feel free to come back anytime.",
+    "ok": "Got it. Anything else I can help with?",
+    "okay": "Got it. Anything else I can help with?",
+})
+
+
+def _normalize_query(text: str) -> str:
+    """Whitespace-normalized query text, for cache keys that must match the query exactly."""
+    return " ".join(text.split())
+
+
+def _truncate(text: str, limit: int) -> str:
+    """Cut text to limit characters, marking the cut with an ellipsis."""
+    return text if len(text) <= limit else text[:limit] + "…"
+
+
+def _result_snippet(item: Any) -> str:
+    """One-line preview of a search result (its chunk/text, else its leading fields as JSON), capped at _SNIPPET_CHARS."""
+    if isinstance(item, dict):
+        # only the first few fields are serialized: the rest would be cut off anyway
+        text = item.get("chunk") or item.get("text") or json.dumps(dict(islice(item.items(), _SNIPPET_KEYS)))
+    else:
+        text = str(item)
+    text = text.strip()
+    # cut before flattening newlines: long KB chunks are only scanned up to the cap
+    if len(text) > _SNIPPET_CHARS:
+        return text[:_SNIPPET_CHARS].replace("\n", " ").rstrip() + "..."
+    return text.replace("\n", " ")
+
+
+def _budget_context(context: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    """
+    The last _MAX_CTX_MSGS messages within _MAX_CTX_CHARS of content.
+
+    Newer messages take the budget first; the message that crosses it is
+    truncated (as a copy) and anything older is dropped.
+    """
+    budget = _MAX_CTX_CHARS
+    kept: List[Dict[str, str]] = []
+    for msg in reversed(context[-_MAX_CTX_MSGS:]):
+        if budget <= 0:
+            break
+        content = msg.get("content") or ""
+        if len(content) > budget:
+            msg = {**msg, "content": _truncate(content, budget)}
+        budget -= len(content)
+        kept.append(msg)
+    kept.reverse()
+    return kept
+
+# Per-round planner user prompt; only these five fields change between ReAct rounds
+_PLANNER_USER_PROMPT_TEMPLATE = """
+User query: {query}
+Current intent: {intent}
+Slots: {slots}
+Previous steps:
+{steps}
+Recent observations:
+{observations}
+"""
+
+# Shape of a planner reply, passed to the backend's structured-output mode
+_PLAN_STEP_SCHEMA: Final = {
+    "title": "plan_step",
+    "type": "object",
+    "properties": {
+        "thought": {"type": "string"},
+        "action": {"type": ["string", "null"]},
+        "input": {"type": "object"},
+        "decide_next": {"type": "boolean"},
+        "actions": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"action": {"type": "string"}, "input": {"type": "object"}},
+                "required": ["action"],
+            },
+        },
+    },
+    "required": ["thought", "action", "decide_next"],
+}
+
+# Planner system prompt; `{tool_info}` is filled once per Agent with the tool schema JSON
+_PLANNER_SYSTEM_PROMPT_TEMPLATE = """
+You are a reasoning assistant that plans step-by-step actions to complete user intents.
+
+Available tools:
+{tool_info}
+
+CRITICAL TOOL USAGE RULES:
+
+1. TOOL NAME: Use ONLY the tool name in "action" field (e.g., "weather", "gmail", "vdb", "memory")
+   - The system automatically finds the right method to call
+   - Do NOT use "tool.method" format
+
+2. PARAMETERS: Pass parameters DIRECTLY in "input" as key-value pairs
+   - Use parameter names from "parameters.properties" schema above
+   - Check "required" array for mandatory parameters
+   - Do NOT nest parameters in "params" or "method" fields
+
+3. INDEPENDENT CALLS: If several tool calls do not depend on each other's results, list them
+   all in "actions" (each with its own "action" and "input") and set "action" to null;
+   they run in parallel
+
+EXAMPLES:
+
+Weather query:
+{{
+  "thought": "User wants weather in Singapore",
+  "action": "weather",
+  "input": {{"location": "Singapore"}},
+  "decide_next": false
+}}
+
+Email summary:
+{{
+  "thought": "User wants last 5 emails",
+  "action": "gmail",
+  "input": {{"count": 5}},
+  "decide_next": false
+}}
+
+Knowledge search:
+{{
+  "thought": "User wants to search knowledge base about machine learning",
+  "action": "vdb",
+  "input": {{"query": "What is machine learning?", "top_k": 5}},
+  "decide_next": false
+}}
+
+Independent calls:
+{{
+  "thought": "User wants the Tokyo weather and their last 3 emails",
+  "action": null,
+  "actions": [
+    {{"action": "weather", "input": {{"location": "Tokyo"}}}},
+    {{"action": "gmail", "input": {{"count": 3}}}}
+  ],
+  "decide_next": false
+}}
+
+Respond in JSON:
+{{
+  "thought": "your reasoning on what to do next",
+  "action": "tool_name or 'finish'",
+  "input": {{ "param": "value" }},
+  "decide_next": true/false
+}}
+"""
+
+# System prompts of direct QA and summarization (with / without recalled memory). Kept as fixed
+# module constants so every request starts with the same bytes and hits the backend's prefix cache
+_QA_PROMPT = "You are a helpful assistant. Answer naturally and clearly in the same language as the user."
+_QA_MEMORY_PROMPT = """You are a helpful assistant that answers questions based on retrieved conversation history.
+
+IMPORTANT: The "Previous memory:" or "Conversation recall:" section contains information that the user previously provided or discussed.
+You should use this information to answer the user's question directly and accurately.
+- If the memory contains the requested information, provide it clearly
+- Do NOT refuse to share information that was retrieved from the user's own conversation history
+- The user is asking you to recall information they previously told you, so you should share it
+
+Answer naturally and clearly in the same language as the user."""
+_SUMMARY_PROMPT = "You are a helpful assistant. Combine the gathered information into a clear, natural summary."
+_SUMMARY_MEMORY_PROMPT = """You are a helpful assistant that answers questions based on retrieved conversation history.
+
+IMPORTANT: The "Conversation recall:" section contains information that the user previously provided or discussed. 
+You should use this information to answer the user's question directly and accurately.
+- If the recall contains the requested information, provide it clearly
+- Do NOT refuse to share information that was retrieved from the user's own conversation history
+- The user is asking you to recall information they previously told you, so you should share it
+
+Combine the gathered information into a clear, natural answer that addresses the user's query."""
+
 
 class Agent:
     """
@@ -40,7 +326,8 @@ class Agent:
 
     def __init__(self, max_rounds: int = 6, short_mem_limit: int = 5):
         # === Core Modules ===
-        self.llm = LLMProvider()
+        self._http = get_session()
+        self.llm = LLMProvider(http_client=get_httpx_client())
         self.intent_recognizer = IntentRecognizer(self.llm)
         self.guard = SecurityGuard()
 
@@ -48,27 +335,79 @@ class Agent:
         self.mem = SQLiteStore()
         self.short_mem = ShortTermMemory(limit=short_mem_limit)
         self.session_mem = SessionMemory(self.mem)
-        self.longterm_mem = LongTermMemoryStore()
+        # Long-term store (embedding model + vector index) is built on first use, see longterm_mem;
+        # the top-k kernels are compiled now so neither that nor the first search pays for the JIT
+        similarity.warmup()
 
         # === Tool Registry ===
+        vdb = VDBAdapter()
+        # One embedding per distinct text per turn, shared by the semantic caches and long-term recall
+        self._embed_fn = vdb.embed
+        self._embedding_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._embedding_lock = threading.Lock()
         self.tools = ToolRegistry({
-            "weather": WeatherAdapter(),
+            "weather": WeatherAdapter(http=self._http),
             "gmail": GmailAdapter(),
-            "vdb": VDBAdapter(),
-            "memory":ConversationMemoryAdapter(self.longterm_mem)
+            "vdb": vdb,
+            "memory": ConversationMemoryAdapter(lambda: self.longterm_mem)
         })
 
+        # === Semantic cache for intent / planning LLM calls ===
+        self.llm_cache: Optional[SemanticLLMCache] = None
+        if settings.SEMANTIC_CACHE_ENABLED:
+            self.llm_cache = SemanticLLMCache(
+                embed_fn=self._embed_texts,
+                capacity=settings.SEMANTIC_CACHE_SIZE,
+                threshold=settings.SEMANTIC_CACHE_THRESHOLD,
+            )
+
+        # === Cache for final answers (direct QA / summaries), scoped per user and exact query ===
+        self.answer_cache: Optional[SemanticLLMCache] = None
+        if settings.ANSWER_CACHE_ENABLED:
+            self.answer_cache = SemanticLLMCache(
+                embed_fn=self._embed_texts,
+                capacity=settings.ANSWER_CACHE_SIZE,
+                threshold=settings.ANSWER_CACHE_THRESHOLD,
+                ttl=settings.ANSWER_CACHE_TTL,
+            )
+
+        # Planner prompt embeds the tool schema JSON; built here so the first planning round
+        # doesn't pay for it, and rebuilt only when the registry changes
+        self._planner_prompt: Tuple[int, str] = (-1, "")
+        self._planner_system_prompt()
+
+        # Long-term memory inserts (embedding + vector write) run off the response path.
+        # One worker keeps them in turn order; the executor is drained at interpreter exit.
+        self._persist_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="persist")
+        self._last_persist: Optional[Future] = None
+
+        # Independent intents of a turn run their ReAct loops on this shared pool
+        # (no per-turn thread start-up); _run_intent never submits back to it. A turn's
+        # recall prefetch is queued before its loops, so a loop waiting on it never starves it.
+        self._intent_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="intent")
+        # Independent tool calls planned together in one round run here; tools never submit to it
+        self._tool_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="tool")
+
         # === Safety Control ===
         self.max_rounds = max_rounds
+        self.chit_chat_bypassed = 0  # turns answered by the greeting/acknowledgement fast path
+        self._stats_lock = threading.Lock()  # handle/ahandle run turns on several threads
+
+    @cached_property
+    def longterm_mem(self) -> LongTermMemoryStore:
+        """Long-term memory store, constructed on first access (cached_property serializes first use)."""
+        return LongTermMemoryStore()
 
     # =====================================================
     # === Public API ===
     # =====================================================
-    def _secure_inbound(self, text: str) -> str:
+    def _secure_inbound(self, text: str) -> Dict:
         """
         Secure inbound text by validating and sanitizing.
+
+        Returns the blocked-answer response for unsafe input, otherwise the
+        guard check with the masked "text" and this turn's "mask_map".
         """
-        masked_input = text
         check = self.guard.inbound(text)
         if not check["safe"]:
             # Unsafe query, blocked before processing
@@ -82,34 +421,165 @@ class Agent:
                 "used_tools": [],
                 "citations": [],
             }
-        masked_input = check["text"]
-        return masked_input
+        return check
 
-    def _secure_outbound(self, result: Dict) -> Dict:
+    def _secure_outbound(self, result: Dict, mask_map: Dict[str, str]) -> Dict:
         """
         Secure outbound text by validating and sanitizing.
         """
         if "answer" not in result:
             return result
 
-        answer = result["answer"]
+        # unmask this turn's inbound placeholders (single pass), then mask any PII in the answer
+        result["answer"] = self.guard.outbound(result["answer"], mask_map)["text"]
+        result["secure_mode"] = True
+        return result
 
-        # inbound had masked PII
-        if getattr(self.guard, "mask_map", None):
-            # unmask known placeholders
-            for original, mask in self.guard.mask_map.items():
-                answer = answer.replace(mask, original)
 
-        # mask new PII if any
-        result["answer"] = self.guard.outbound(answer)["text"]
-        result["secure_mode"] = True
+    def _store_longterm_async(
+        self, user_id: str, session_id: str, messages: List[Dict[str, str]], start_index: int
+    ) -> None:
+        """Queue new turns for long-term memory without blocking the response."""
+        messages = list(messages)  # snapshot; short-term memory keeps moving
+
+        def store():
+            try:
+                self.longterm_mem.store_conversation(user_id, session_id, messages, start_index=start_index)
+            except Exception as e:
+                logger.error(f"Failed to store long-term memory: {e}", exc_info=True)
 
-        # reset for next round
-        self.guard.mask_map.clear()
+        try:
+            self._last_persist = self._persist_pool.submit(store)
+        except RuntimeError:  # pool shut down by close() while this turn was in flight
+            logger.warning(f"Agent closed; skipped long-term write for session {session_id}")
+
+    def _commit_turn(
+        self,
+        user_id: str,
+        session_id: str,
+        user_text: str,
+        answer: str,
+        intent_rows: List[Dict[str, Any]],
+        steps: List[Dict[str, Any]],
+        session_data: Dict[str, Any],
+        longterm: bool = True,
+        clear_pending: bool = True,
+    ) -> None:
+        """
+        Record a finished turn in every memory layer with one durable commit.
+
+        Short-term memory is in-process, the session context and the stale
+        clarification are written in a single SQLite transaction (the latter
+        only if clear_pending), and new turns are queued for long-term memory
+        off the response path (unless longterm=False).
+        """
+        turn = [{"role": "user", "content": user_text}, {"role": "assistant", "content": answer}]
+        try:
+            for message in turn:
+                self.short_mem.add(message["role"], message["content"])
+        except Exception as e:
+            logger.error(f"Failed to update short-term memory: {e}", exc_info=True)
+
+        # Count of this session's messages already in long-term memory; the bounded
+        # short-term buffer cannot be used as the index once it starts evicting
+        prev_saved = session_data.get("longterm_saved", 0)
+
+        new_session_data = {
+            "last_intents": intent_rows,
+            "last_steps": steps,
+            "conversation_history": self.short_mem.get_context(),
+            "clarification_pending": None,
+            "longterm_saved": prev_saved + len(turn) if longterm else prev_saved,
+        }
+        try:
+            updates = {"context": new_session_data}
+            if clear_pending:
+                updates["pending_context"] = None
+            self.session_mem.write_many(user_id, session_id, updates)
+        except Exception as e:
+            logger.error(f"Failed to write session memory: {e}", exc_info=True)
+
+        if longterm:
+            self._store_longterm_async(user_id, session_id, turn, prev_saved)
+
+    def _chit_chat_reply(
+        self,
+        user_id: str,
+        session_id: str,
+        text: str,
+        phrase: str,
+        session_data: Dict[str, Any],
+        mask_map: Optional[Dict[str, str]],
+    ) -> Dict:
+        """
+        Canned reply for a trivial turn; recorded in short-term and session memory only.
+
+        A pending clarification is left in place, so "thanks" in the middle of
+        one does not discard the user's pending context.
+        """
+        answer = _CHIT_CHAT_REPLIES[phrase.lower()]
+        self._commit_turn(
+            user_id, session_id, text, answer, [], [], session_data, longterm=False, clear_pending=False
+        )
+        result = {
+            "type": "answer",
+            "answer": answer,
+            "intents": [],
+            "steps": [],
+            "used_tools": [],
+            "citations": [],
+            "trace": PlanTrace(user_query=text).to_dict(),
+        }
+        if mask_map is not None:
+            result = self._secure_outbound(result, mask_map)
         return result
 
+    def close(self) -> None:
+        """Drain queued long-term writes and shut down the Agent's worker pools."""
+        self._persist_pool.shutdown(wait=True)
+        self._intent_pool.shutdown(wait=True)
+        self._tool_pool.shutdown(wait=True)
+
+    def _search_longterm(self, user_id: str, session_id: str, query: str) -> List[Dict[str, Any]]:
+        """Top-3 long-term memories of this user's session for query."""
+        self.wait_for_persistence()  # recall must see the turns queued just before
+        return self.longterm_mem.search(
+            query,
+            top_k=3,
+            query_emb=self._embed(query),
+            user_id=user_id,
+            session_id=session_id,
+        )
 
-    def handle(self, user_id: str, text: str, session_id: str = "default", secure_mode: bool = False) -> Dict:
+    def _prefetch_recall(self, user_id: str, session_id: str, query: str) -> Optional[Tuple[str, Future]]:
+        """
+        Start the long-term search for a query that looks like a recall request.
+
+        Runs on the intent pool while intents are recognized; a recall intent
+        whose memory query is this query waits on it instead of searching
+        again, otherwise the result is unused.
+        """
+        if not _RECALL_CUE_RE.search(query):
+            return None
+        try:
+            return query, self._intent_pool.submit(self._search_longterm, user_id, session_id, query)
+        except RuntimeError:  # pool shut down by close()
+            return None
+
+    def wait_for_persistence(self, timeout: Optional[float] = None) -> None:
+        """Block until every queued long-term memory write has finished."""
+        pending = self._last_persist
+        if pending is not None:
+            pending.result(timeout=timeout)
+
+    def handle(
+        self,
+        user_id: str,
+        text: str,
+        session_id: str = "default",
+        secure_mode: bool = False,
+        on_token: Optional[Callable[[str], None]] = None,
+    ) -> Dict:
         """
         Main entry point for processing a user query.
         Pipeline:
@@ -119,27 +589,42 @@ class Agent:
           4. Plan and execute (long-term memory only when explicitly requested)
           5. Update memories
           6. Return structured output
+
+        If `on_token` is given, chunks of the final answer (the summary, or a lone
+        direct-QA answer) are passed to it as the LLM generates them; the returned
+        dict still carries the full answer. Streaming is disabled in secure mode,
+        where the answer must be unmasked and re-masked as a whole.
         """
+        if secure_mode:
+            on_token = None
         logger.info(f"Handling query for user {user_id}: {text[:100]}")
 
+        mask_map: Optional[Dict[str, str]] = None  # placeholders issued for this turn (secure mode)
         if secure_mode:
-            masked_input = self._secure_inbound(text)
-            if isinstance(masked_input, dict) and masked_input.get("type") == "answer":
-                return masked_input
-            text = masked_input
+            check = self._secure_inbound(text)
+            if check.get("type") == "answer":
+                return check
+            text, mask_map = check["text"], check["mask_map"]
 
         # === 1. Load memory context ===
         context = self.short_mem.get_context()
         session_ctx = self.session_mem.read(user_id, session_id, "context")
 
-        session_data = {}
-        if isinstance(session_ctx, list) and len(session_ctx) > 0:
-            session_ctx = session_ctx[-1].get("content", "{}")
-        try:
-            if isinstance(session_ctx, str):
+        # Contexts written by this process come back as the cached dict; only a
+        # context loaded from SQLite (e.g. after a restart) needs parsing
+        session_data = session_ctx if isinstance(session_ctx, dict) else {}
+        if isinstance(session_ctx, str) and session_ctx[:1] == "{":
+            try:
                 session_data = json.loads(session_ctx)
-        except Exception as e:
-            logger.warning(f"Failed to parse session context: {e}")
+            except json.JSONDecodeError as e:
+                logger.warning(f"Failed to parse session context: {e}")
+
+        # Greetings and acknowledgements skip intent recognition, planning and long-term memory
+        match = _CHIT_CHAT_RE.fullmatch(text)
+        if match:
+            with self._stats_lock:
+                self.chit_chat_bypassed += 1
+            return self._chit_chat_reply(user_id, session_id, text, match.group(1), session_data, mask_map)
 
         # === 2. Enhance incomplete query with short-term and session memory ===
         enhanced_query = self._enhance_query_with_context(text, context, session_data)
@@ -147,18 +632,20 @@ class Agent:
             logger.info(f"Query enhanced: '{text}' -> '{enhanced_query[:100]}'")
 
         # === 3. Intent recognition ===
-        # Use enhanced query for intent recognition, but only with short-term and session context
-        intents = self._recognize_intents(enhanced_query, context)
-        logger.debug(f"Recognized intents: {intents}")
+        # Use enhanced query for intent recognition, but only with short-term and session context;
+        # a likely recall request searches long-term memory meanwhile
+        recall = self._prefetch_recall(user_id, session_id, enhanced_query)
+        intents = self._recognize_intents(user_id, enhanced_query, context)
+        logger.debug("Recognized intents: %s", intents)
         if isinstance(intents, dict) and intents.get("type") == "clarification":
             pending_context = {
                 "clarification_type": "intent_ambiguous",
                 "original_query": text,
                 "pending_intents": [],
                 "pending_steps": [],
-                "timestamp": datetime.now().isoformat()
+                "timestamp": time_ns()  # epoch nanoseconds
             }
-            self.session_mem.write(user_id, session_id, "pending_context", json.dumps(pending_context))
+            self.session_mem.write(user_id, session_id, "pending_context", pending_context)
             logger.info("Saved pending context for intent clarification")
             return intents
 
@@ -166,34 +653,13 @@ class Agent:
             info_text = intents[0].slots.get("text") or text
             acknowledgment = "OK, I have noted the information down."
 
-            self.short_mem.add("user", info_text)
-            self.short_mem.add("assistant", acknowledgment)
-            updated_context = self.short_mem.get_context()
-
-            prev_saved = session_data.get("longterm_saved", 0)
-
-            note_session_data = {
-                "last_intents": [asdict(i) for i in intents],
-                "last_steps": [],
-                "conversation_history": updated_context,
-                "clarification_pending": None,
-                "longterm_saved": len(updated_context),
-            }
-            self.session_mem.write(user_id, session_id, "context", json.dumps(note_session_data), None)
-
-            if prev_saved < len(updated_context):
-                new_messages = updated_context[prev_saved:]
-                self.longterm_mem.store_conversation(
-                    user_id,
-                    session_id,
-                    new_messages,
-                    start_index=prev_saved,
-                )
+            intent_rows = [i.to_dict() for i in intents]
+            self._commit_turn(user_id, session_id, info_text, acknowledgment, intent_rows, [], session_data)
 
             return {
                 "type": "answer",
                 "answer": acknowledgment,
-                "intents": [asdict(i) for i in intents],
+                "intents": intent_rows,
                 "steps": [],
                 "used_tools": [],
                 "citations": [],
@@ -202,8 +668,11 @@ class Agent:
 
         # === 4. Plan and execute (long-term memory only when explicitly requested) ===
         # Use context without long-term memory initially
-        result = self._plan_and_execute(user_id, enhanced_query, intents, context, session_id)
-        logger.debug(f"Plan and execute result: {result.get('type')} | steps={len(result.get('steps', []))}")
+        result = self._plan_and_execute(
+            user_id, enhanced_query, intents, context, session_id,
+            use_cache=not secure_mode, on_token=on_token, recall=recall,
+        )
+        logger.debug("Plan and execute result: %s | steps=%d", result.get("type"), len(result.get("steps", [])))
         
         # Ensure result has answer field
         if not result.get("answer"):
@@ -212,55 +681,55 @@ class Agent:
             else:
                 result["answer"] = "Sorry, I encountered an issue while processing your request. Please try again."
         
+        # Reuse the intent rows _plan_and_execute already serialized for the response
+        intent_rows = result.get("intents")
+        if intent_rows is None:
+            intent_rows = [i.to_dict() for i in intents] if isinstance(intents, list) else []
+
         if result.get("type") == "clarification":
             result["steps"] = result.get("steps", [])
-            result["intents"] = [asdict(i) for i in intents] if isinstance(intents, list) else []
+            result["intents"] = intent_rows
             pending_context = {
                 "clarification_type": "tool_failed",
                 "original_query": text,
                 "pending_intents": result["intents"],
                 "pending_steps": result["steps"],
-                "timestamp": datetime.now().isoformat()
+                "timestamp": time_ns()  # epoch nanoseconds
             }
-            self.session_mem.write(user_id, session_id, "pending_context", json.dumps(pending_context))
+            self.session_mem.write(user_id, session_id, "pending_context", pending_context)
             return result
 
         # === 5. Update memories ===
-        try:
-            self.short_mem.add("user", text)  # Store original query, not enhanced
-            self.short_mem.add("assistant", result.get("answer", ""))
-        except Exception as e:
-            logger.error(f"Failed to update short-term memory: {e}", exc_info=True)
-
-        updated_context = self.short_mem.get_context()
-        prev_saved = session_data.get("longterm_saved", 0)
-
-        session_data = {
-            "last_intents": [asdict(i) for i in intents] if isinstance(intents, list) else [],
-            "last_steps": result.get("steps", []),
-            "conversation_history": updated_context,
-            "clarification_pending": None,
-            "longterm_saved": len(updated_context)
-        }
-        
-        try:
-            self.session_mem.write(user_id, session_id, "context", json.dumps(session_data), None)
-        except Exception as e:
-            logger.error(f"Failed to write session memory: {e}", exc_info=True)
-
-        try:
-            if prev_saved < len(updated_context):
-                new_messages = updated_context[prev_saved:]
-                self.longterm_mem.store_conversation(user_id, session_id, new_messages, start_index=prev_saved)
-        except Exception as e:
-            logger.error(f"Failed to store long-term memory: {e}", exc_info=True)
-
+        # Store original query, not enhanced
+        self._commit_turn(user_id, session_id, text, result.get("answer", ""), intent_rows, result.get("steps", []), session_data)
         logger.info("Memory updated successfully.")
 
         if secure_mode and "answer" in result:
-            result = self._secure_outbound(result)
+            result = self._secure_outbound(result, mask_map)
         return result
 
+    async def ahandle(
+        self,
+        user_id: str,
+        text: str,
+        session_id: str = "default",
+        secure_mode: bool = False,
+        on_token: Optional[Callable[[str], None]] = None,
+    ) -> Dict:
+        """
+        Async entry point for `handle`.
+
+        The pipeline is dominated by blocking I/O (SQLite, vector search, LLM and
+        tool HTTP calls), so it runs in a worker thread and the event loop stays
+        free to serve other requests meanwhile. `on_token` is called from that
+        worker thread.
+        """
+        return await asyncio.to_thread(self.handle, user_id, text, session_id, secure_mode, on_token)
+
+    async def aresume(self, user_id: str, user_reply: str, session_id: str = "default") -> Dict:
+        """Async entry point for `resume` (runs in a worker thread)."""
+        return await asyncio.to_thread(self.resume, user_id, user_reply, session_id)
+
     def resume(self, user_id: str, user_reply: str, session_id: str = "default") -> Dict:
         """
         Called when user answers a clarification prompt.
@@ -278,9 +747,8 @@ class Agent:
             original_query = context_json.get("original_query", "")
 
             if clarification_type == "intent_ambiguous":
-                context = self.short_mem.get_context()
-                context.append({"role": "user", "content": user_reply})
-                intents = self._recognize_intents(user_reply, context)
+                context = self.short_mem.get_context() + [{"role": "user", "content": user_reply}]
+                intents = self._recognize_intents(user_id, user_reply, context)
                 self.session_mem.write(user_id, session_id, "pending_context", None)
                 return self._plan_and_execute(user_id, user_reply, intents, context, session_id)
 
@@ -391,250 +859,127 @@ class Agent:
         
         return query
 
-    def _recognize_intents(self, text: str, context: List[Dict[str, str]]) -> List[Intent] | Dict:
-        """Use LLM to identify structured intents."""
+    def _recognize_intents(self, user_id: str, text: str, context: List[Dict[str, str]]) -> List[Intent] | Dict:
+        """
+        Use LLM to identify structured intents.
+
+        Cached intents carry slots extracted from their query, so the cache key
+        holds the user and the exact (whitespace-normalized) text: a merely
+        similar query, or another user's, must not reuse them. Explicit notes
+        and bare "weather in <Place>" questions skip the LLM altogether.
+        """
+        match = _NOTE_RE.fullmatch(text)
+        if match:
+            return [Intent("note_down", {"text": match.group("text").strip()}, 1.0)]
+        match = _WEATHER_IN_RE.fullmatch(text)
+        if match:
+            return [Intent("get_weather", {"location": match.group("location")}, 1.0)]
         try:
+            query = _normalize_query(text)
+            cache_key = prompt_hash("intent", user_id, query, json.dumps(context[-3:]))
+            cached = self._cache_lookup(query, cache_key)
+            if cached is not None:
+                logger.info("Intent recognition served from cache")
+                return [replace(i, slots=dict(i.slots)) for i in cached]
+
             result = self.intent_recognizer.recognize(text, context)
             if isinstance(result, dict) and result.get("type") == "clarification":
                 return result
             if isinstance(result, list):
+                self._cache_store(query, cache_key, [replace(i, slots=dict(i.slots)) for i in result])
                 return result
-            return {
-                "type": "clarification",
-                "message": "I’m not sure what you mean. Please clarify:",
-                "options": ["Check weather", "Read emails", "Search knowledge base"]
-            }
+            return _clarification(_INTENT_CLARIFY_DEFAULT)
         except Exception as e:
             logger.error(f"Intent recognition failed: {e}", exc_info=True)
-            return {
-                "type": "clarification",
-                "message": "An error occurred while interpreting your request.",
-                "options": ["Retry", "Rephrase"]
-            }
+            return _clarification(_INTENT_CLARIFY_ERROR)
+
+    def _planner_system_prompt(self) -> str:
+        """Planner system prompt for the current tool set (serialized once per registry version)."""
+        version, prompt = self._planner_prompt
+        if version != self.tools.version:
+            version = self.tools.version
+            prompt = _PLANNER_SYSTEM_PROMPT_TEMPLATE.format(
+                tool_info=json.dumps(self.tools.describe(), indent=True)
+            )
+            self._planner_prompt = (version, prompt)  # single tuple swap is thread-safe
+        return prompt
 
     def _plan_and_execute(
-        self, user_id: str, user_query: str, intents: List[Intent], context: List[Dict[str, str]], session_id: str
+        self, user_id: str, user_query: str, intents: List[Intent], context: List[Dict[str, str]], session_id: str,
+        use_cache: bool = True,
+        on_token: Optional[Callable[[str], None]] = None,
+        recall: Optional[Tuple[str, Future]] = None,
     ) -> Dict:
-        """Main ReAct-style reasoning and tool execution loop."""
-        steps, used_tools, citations, observations = [], [], [], []
-        trace = PlanTrace(user_query=user_query)  
-
-        for intent in intents:
-            round_count = 0
-            done = False
-            logger.debug(f"Starting intent loop: {intent.name} with slots={intent.slots}")
-
-            intent_context = context
-            memory_results: List[Dict[str, Any]] = []
-            memory_hits_only = False
-            
-            # === Only retrieve long-term memory for explicit recall requests ===
-            if intent.name == "recall_conversation" or getattr(intent, "memory_hint", False):
-                memory_query = intent.slots.get("query") or user_query
-                try:
-                    memory_results = self.longterm_mem.search(
-                        memory_query,
-                        top_k=3,
-                        user_id=user_id,
-                        session_id=session_id,
-                    )
-                    if memory_results:
-                        intent_context = self._merge_context(context, memory_results)
-                        observations.append(self._format_observation({
-                            "scope": "longterm",
-                            "results": memory_results
-                        }))
-                        memory_hits_only = True
-                        logger.info(f"Retrieved {len(memory_results)} long-term memory results for recall request")
-                except Exception as e:
-                    logger.error(f"Long-term memory search failed: {e}", exc_info=True)
-
-            while not done and round_count < self.max_rounds:
-                round_count += 1
-                step = self._plan_next_step(intent, user_query, steps, observations, intent_context)
-                logger.debug(f"Planned step: {step}")
-                if not step:
-                    done = True
-                    break
+        """
+        Main ReAct-style reasoning and tool execution loop.
 
-                step.memory_used = bool(getattr(intent, "memory_hint", False) and memory_results)
-
-                if step.action and step.action != "finish":
-                    # Prevent LLM from calling memory tool unless intent is recall_conversation
-                    if step.action == "memory" and intent.name != "recall_conversation":
-                        logger.warning(f"LLM tried to call memory tool for intent {intent.name}, skipping")
-                        step.thought += " | Memory tool skipped (not a recall request)"
-                        step.action = "finish"
-                        step.status = "skipped"
-                        trace.add_step(step)
-                        steps.append(step)
-                        continue
-                    
-                    if (
-                        step.action == "vdb"
-                        and memory_hits_only
-                        and intent.name == "query_knowledge"
-                    ):
-                        query = intent.slots.get("query") or user_query
-                        answer = self._direct_llm_qa(query, intent_context)
-                        step.thought += " | Memory satisfied query; skipped VDB."
-                        step.action = "memory_only"
-                        step.observation = {
-                            "answer": answer,
-                            "memory_results": memory_results,
-                        }
-                        step.status = "succeeded"
-                        step.decide_next = False
-                        step.memory_used = True
-                        observations.append(answer)
-                        trace.add_step(step)
-                        steps.append(step)
-                        break
-                    if step.action == "memory":
-                        step.input.setdefault("user_id", user_id)
-                        step.input.setdefault("session_id", session_id)
-                    try:
-                        observation = self.tools.invoke(step.action, **step.input)
-                        logger.debug(f"Tool '{step.action}' observation: {observation}")
-                        step.observation = observation
-                        if isinstance(observation, dict) and observation.get("error"):
-                            error_msg = observation.get("error", "Unknown error")
-                            step.status = "failed"
-                            step.error = error_msg
-                            used_tools.append({
-                                "name": step.action,
-                                "inputs": step.input,
-                                "outputs": observation,
-                                "status": "failed"
-                            })
-                            trace.add_step(step)
-                            steps.append(step)
-                            logger.info(f"Tool {step.action} returned error: {error_msg}")
-                            return {
-                                "type": "clarification",
-                                "message": f"Tool {step.action} returned an error: {error_msg}. Retry?",
-                                "options": ["Retry", "Cancel"],
-                                "steps": [asdict(s) for s in steps],
-                                "intents": [asdict(i) for i in intents],
-                                "trace": trace.to_dict()
-                            }
-                        if step.action == "vdb" and isinstance(observation, dict) and not observation.get("results"):
-                            logger.info("Knowledge search returned no results; falling back to direct LLM QA.")
-                            fallback_answer = self._direct_llm_qa(user_query, intent_context)
-                            observations.append("Knowledge search returned no results about the question.")
-                            observations.append(fallback_answer)
-                            step.observation = {
-                                "scope": "knowledge",
-                                "results": observation.get("results", []),
-                                "fallback_answer": fallback_answer,
-                            }
-                            step.status = "succeeded"
-                            used_tools.append({
-                                "name": "llm_fallback",
-                                "inputs": {"query": user_query},
-                                "outputs": {"answer": fallback_answer},
-                                "status": "succeeded"
-                            })
-                            trace.add_step(step)
-                            steps.append(step)
-                            break
-                        step.status = "succeeded"
-                        obs_str = self._format_observation(observation)
-                        observations.append(obs_str)
-                        used_tools.append({
-                            "name": step.action,
-                            "inputs": step.input,
-                            "outputs": observation,
-                            "status": "succeeded"
-                        })
-                    except Exception as e:
-                        step.status = "failed"
-                        step.error = str(e)
-                        logger.error(f"Tool {step.action} invocation raised exception: {e}", exc_info=True)
-                        trace.add_step(step)  # record even failed step
-                        return {
-                            "type": "clarification",
-                            "message": f"Tool {step.action} failed: {e}. Retry?",
-                            "options": ["Retry", "Cancel"],
-                            "steps": [asdict(s) for s in steps],
-                            "intents": [asdict(i) for i in intents],
-                            "trace": trace.to_dict()  # new field
-                        }
-                elif intent.name in ("general_qa", "potential_knowledge_qa"):
-                    query = intent.slots.get("query") or user_query
-                    rag_answer = None
-                    retrieval_used = False
-                    retrieval_payload: Optional[Dict[str, Any]] = None
-
-                    if intent.name == "potential_knowledge_qa":
-                        try:
-                            retrieval_payload = self.tools.invoke("vdb", query=query, top_k=3)
-                            retrieval_used = True
-                            used_tools.append({
-                                "name": "vdb",
-                                "inputs": {"query": query, "top_k": 3},
-                                "outputs": retrieval_payload,
-                                "status": "succeeded"
-                            })
-                            results = retrieval_payload.get("results", []) if isinstance(retrieval_payload, dict) else []
-                            best_score = max((float(result.get("score", 0.0)) for result in results), default=0.0)
-                            if results and best_score > 0.65:
-                                observations.append(self._format_observation(retrieval_payload))
-                                augmented_context = list(context)
-                                snippets = "\n".join(
-                                    f"- {item.get('chunk', '').strip()}" for item in results[:3]
-                                ).strip()
-                                if snippets:
-                                    augmented_context.append({
-                                        "role": "system",
-                                        "content": f"Relevant knowledge:\n{snippets}"
-                                    })
-                                rag_answer = self._direct_llm_qa(query, augmented_context)
-                        except Exception as e:
-                            logger.error(f"Vector DB retrieval failed: {e}", exc_info=True)
-                            used_tools.append({
-                                "name": "vdb",
-                                "inputs": {"query": query, "top_k": 3},
-                                "outputs": {"error": str(e)},
-                                "status": "failed"
-                            })
-
-                    answer = rag_answer or self._direct_llm_qa(query, intent_context)
-                    logger.debug(f"QA response ({intent.name}): {answer}")
-
-                    observation_payload: Dict[str, Any] = {"answer": answer}
-                    if retrieval_used and retrieval_payload:
-                        observation_payload["retrieval"] = retrieval_payload
-
-                    step.observation = observation_payload
-                    step.status = "succeeded"
-                    observations.append(answer)
+        use_cache=False bypasses the answer cache; on_token receives the final
+        answer as it streams; recall is a (query, search) pair from _prefetch_recall.
+        """
+        response_key = self._response_key(user_id, user_query, intents) if use_cache else None
+        if response_key is not None:
+            cached = self._lookup_answer(user_query, response_key)
+            if cached is not None:
+                logger.info("Turn result served from cache")
+                if on_token is not None:
+                    on_token(cached["answer"])
+                return deepcopy(cached)  # the entry is shared; callers may mutate nested rows
 
-                trace.add_step(step)   # replaces steps.append(step)
-                steps.append(step)     # keep legacy list for backward compatibility
+        steps, used_tools, citations, observations = [], [], [], []
+        trace = PlanTrace(user_query=user_query)  
 
-                should_continue = step.decide_next if step.action != "finish" else False
-                if (
-                    step.status in ("finished", "failed")
-                    or step.action == "finish"
-                    or not should_continue
-                ):
-                    done = True
+        # Independent intents run their ReAct loops concurrently; results are merged in intent order.
+        # The calling thread runs the first intent itself instead of idling on the pool.
+        # A single intent may stream its direct-QA answer, which is then the final answer
+        stream_to = on_token if len(intents) == 1 else None
+        run_intent = lambda intent: self._run_intent(
+            user_id, user_query, intent, context, session_id, use_cache, recall, stream_to
+        )
+        runs: List[IntentRun] = []
+        if intents:
+            pending = [self._intent_pool.submit(run_intent, intent) for intent in intents[1:]]
+            try:
+                runs.append(run_intent(intents[0]))
+                runs.extend(f.result() for f in pending)
+            finally:
+                for f in pending:
+                    f.cancel()  # no-op for finished ones; drops queued loops if this turn failed
+
+        for run in runs:
+            steps.extend(run.steps)
+            used_tools.extend(run.used_tools)
+            observations.extend(run.observations)
+            for step in run.trace_steps:
+                trace.add_step(step)
+
+            if run.clarification:
+                return {
+                    "type": "clarification",
+                    "message": run.clarification,
+                    "options": ["Retry", "Cancel"],
+                    "steps": trace.step_rows(steps),
+                    "intents": [i.to_dict() for i in intents],
+                    "trace": trace.to_dict()
+                }
 
-            if round_count >= self.max_rounds:
+            if run.max_rounds_reached:
                 logger.warning("Max reasoning rounds reached before completion.")
                 return {
                     "type": "answer",
                     "answer": "I reached the reasoning limit but couldn't complete the task. Please restate your question.",
-                    "intents": [asdict(i) for i in intents],
-                    "steps": [asdict(s) for s in steps],
+                    "intents": [i.to_dict() for i in intents],
+                    "steps": trace.step_rows(steps),
                     "used_tools": used_tools,
                     "citations": citations,
                     "trace": trace.to_dict(),  
                 }
 
-        answer = self._summarize_result(user_query, steps, observations)
-        logger.debug(f"Final summarized answer: {answer}")
+        if any(run.answer_streamed for run in runs):
+            on_token = None
+        answer = self._summarize_result(
+            user_query, steps, observations, user_id=user_id, use_cache=use_cache, on_token=on_token
+        )
+        logger.debug("Final summarized answer: %s", answer)
         
         # Ensure answer is not empty
         if not answer or not answer.strip():
@@ -644,135 +989,467 @@ class Agent:
         if citation_entries:
             answer = self._append_citation_block(answer, citation_entries)
             citations = citation_entries
-        return {
+        result = {
             "type": "answer",
             "answer": answer,
-            "intents": [asdict(i) for i in intents],
-            "steps": [asdict(s) for s in steps],
+            "intents": [i.to_dict() for i in intents],
+            "steps": trace.step_rows(steps),
             "used_tools": used_tools,
             "citations": citations,
             "trace": trace.to_dict(),  
         }
+        if response_key is not None and not answer.startswith("Error:"):
+            self._store_answer(user_query, response_key, deepcopy(result), ttl=settings.RESPONSE_CACHE_TTL)
+        return result
 
-    # =====================================================
-    # === Planning Logic (Step-related)
-    # =====================================================
+    def _response_key(self, user_id: str, user_query: str, intents: List[Intent]) -> Optional[int]:
+        """
+        Answer-cache key of a whole turn (user, exact query, intents and slots), or None if not cacheable.
 
-    def _plan_next_step(
-        self, intent: Intent, user_query: str, previous_steps: List[Step],
-        observations: List[str], context: List[Dict[str, str]]
-    ) -> Optional[Step]:
-        """Use LLM to plan the next reasoning step."""
-        try:
-            tool_info = self.tools.describe()
-            system_prompt = f"""
-You are a reasoning assistant that plans step-by-step actions to complete user intents.
+        Only turns whose intents are all slot-complete tool calls are cached: their
+        result depends on the slots alone, never on the conversation or session,
+        which a QA answer does and this key does not hold.
+        """
+        if self.answer_cache is None or not isinstance(intents, list) or not intents:
+            return None
+        if any(
+            i.name in _UNCACHED_RESPONSE_INTENTS or i.memory_hint or not self._is_slot_complete(i) for i in intents
+        ):
+            return None
+        return prompt_hash(
+            "response",
+            self.llm.provider,
+            str(self.tools.version),
+            user_id,
+            _normalize_query(user_query),
+            json.dumps([[i.name, i.slots] for i in intents], sort_keys=True),
+        )
 
-Available tools:
-{json.dumps(tool_info, indent=2)}
+    def _run_intent(
+        self, user_id: str, user_query: str, intent: Intent, context: List[Dict[str, str]], session_id: str,
+        use_cache: bool = True,
+        recall: Optional[Tuple[str, Future]] = None,
+        on_token: Optional[Callable[[str], None]] = None,
+    ) -> IntentRun:
+        """
+        Run the ReAct loop for a single intent; safe to call from a worker thread.
 
-CRITICAL TOOL USAGE RULES:
+        on_token receives a direct-QA answer that will be the turn's final answer:
+        one produced by the first step, which also ends the loop.
+        """
+        run = IntentRun(intent=intent.name)
+        steps, used_tools, observations = run.steps, run.used_tools, run.observations
+        # the loop records into these lists several times per round; bind the appends once
+        add_step, add_trace_step = steps.append, run.trace_steps.append
+        add_tool, add_observation = used_tools.append, observations.append
+        round_count = 0
+        done = False
+        logger.debug("Starting intent loop: %s with slots=%s", intent.name, intent.slots)
+
+        intent_context = context
+        memory_results: List[Dict[str, Any]] = []
+        memory_hits_only = False
+        slots_json = _truncate(json.dumps(intent.slots), _MAX_SLOT_CHARS)  # slots are fixed for the whole loop
+        
+        # === Only retrieve long-term memory for explicit recall requests ===
+        if intent.name == "recall_conversation" or intent.memory_hint:
+            memory_query = intent.slots.get("query") or user_query
+            try:
+                if recall is not None and recall[0] == memory_query:
+                    memory_results = recall[1].result()
+                else:
+                    memory_results = self._search_longterm(user_id, session_id, memory_query)
+                if memory_results:
+                    intent_context = self._merge_context(context, memory_results)
+                    add_observation(self._format_observation({
+                        "scope": "longterm",
+                        "results": memory_results
+                    }))
+                    memory_hits_only = True
+                    logger.info(f"Retrieved {len(memory_results)} long-term memory results for recall request")
+            except Exception as e:
+                logger.error(f"Long-term memory search failed: {e}", exc_info=True)
+
+        while not done and round_count < self.max_rounds:
+            round_count += 1
+            step = self._direct_step(intent) if round_count == 1 else None
+            if step is None:
+                step = self._plan_next_step(intent, user_query, steps, observations, intent_context, slots_json)
+            logger.debug("Planned step: %s", step)
+            if not step:
+                done = True
+                break
+
+            if isinstance(step, list):
+                self._invoke_batch(run, intent, step, user_id, session_id, bool(intent.memory_hint and memory_results))
+                if run.clarification:
+                    return run
+                done = not step[-1].decide_next
+                continue
 
-1. TOOL NAME: Use ONLY the tool name in "action" field (e.g., "weather", "gmail", "vdb", "memory")
-   - The system automatically finds the right method to call
-   - Do NOT use "tool.method" format
+            step.memory_used = bool(intent.memory_hint and memory_results)
+
+            if step.action and step.action != "finish":
+                # Prevent LLM from calling memory tool unless intent is recall_conversation
+                if step.action == "memory" and intent.name != "recall_conversation":
+                    logger.warning(f"LLM tried to call memory tool for intent {intent.name}, skipping")
+                    step.thought += " | Memory tool skipped (not a recall request)"
+                    step.action = "finish"
+                    step.status = "skipped"
+                    add_trace_step(step)
+                    add_step(step)
+                    continue
+                
+                if (
+                    step.action == "vdb"
+                    and memory_hits_only
+                    and intent.name == "query_knowledge"
+                ):
+                    query = intent.slots.get("query") or user_query
+                    answer = self._direct_llm_qa(query, intent_context, user_id=user_id, use_cache=use_cache)
+                    step.thought += " | Memory satisfied query; skipped VDB."
+                    step.action = "memory_only"
+                    step.observation = {
+                        "answer": answer,
+                        "memory_results": memory_results,
+                    }
+                    step.status = "succeeded"
+                    step.decide_next = False
+                    step.memory_used = True
+                    add_observation(answer)
+                    add_trace_step(step)
+                    add_step(step)
+                    break
+                if step.action == "memory":
+                    step.input.setdefault("user_id", user_id)
+                    step.input.setdefault("session_id", session_id)
+                try:
+                    observation = self.tools.invoke(step.action, **step.input)
+                    logger.debug("Tool '%s' observation: %s", step.action, observation)
+                    step.observation = observation
+                    if isinstance(observation, dict) and observation.get("error"):
+                        error_msg = observation.get("error", "Unknown error")
+                        step.status = "failed"
+                        step.error = error_msg
+                        add_tool({
+                            "name": step.action,
+                            "inputs": step.input,
+                            "outputs": observation,
+                            "status": "failed"
+                        })
+                        add_trace_step(step)
+                        add_step(step)
+                        logger.info("Tool %s returned error: %s", step.action, error_msg)
+                        run.clarification = f"Tool {step.action} returned an error: {error_msg}. Retry?"
+                        return run
+                    if step.action == "vdb" and isinstance(observation, dict) and not observation.get("results"):
+                        logger.info("Knowledge search returned no results; falling back to direct LLM QA.")
+                        fallback_answer = self._direct_llm_qa(
+                            user_query, intent_context, user_id=user_id, use_cache=use_cache
+                        )
+                        add_observation("Knowledge search returned no results about the question.")
+                        add_observation(fallback_answer)
+                        step.observation = {
+                            "scope": "knowledge",
+                            "results": observation.get("results", []),
+                            "fallback_answer": fallback_answer,
+                        }
+                        step.status = "succeeded"
+                        add_tool({
+                            "name": "llm_fallback",
+                            "inputs": {"query": user_query},
+                            "outputs": {"answer": fallback_answer},
+                            "status": "succeeded"
+                        })
+                        add_trace_step(step)
+                        add_step(step)
+                        break
+                    step.status = "succeeded"
+                    obs_str = self._format_observation(observation)
+                    add_observation(obs_str)
+                    add_tool({
+                        "name": step.action,
+                        "inputs": step.input,
+                        "outputs": observation,
+                        "status": "succeeded"
+                    })
+                except Exception as e:
+                    step.status = "failed"
+                    step.error = str(e)
+                    logger.error("Tool %s invocation raised exception: %s", step.action, e, exc_info=True)
+                    add_trace_step(step)  # record even failed step
+                    run.clarification = f"Tool {step.action} failed: {e}. Retry?"
+                    return run
+            elif intent.name in ("general_qa", "potential_knowledge_qa"):
+                query = intent.slots.get("query") or user_query
+                rag_answer = None
+                retrieval_used = False
+                retrieval_payload: Optional[Dict[str, Any]] = None
+
+                if intent.name == "potential_knowledge_qa":
+                    try:
+                        retrieval_payload = self.tools.invoke("vdb", query=query, top_k=3)
+                        retrieval_used = True
+                        add_tool({
+                            "name": "vdb",
+                            "inputs": {"query": query, "top_k": 3},
+                            "outputs": retrieval_payload,
+                            "status": "succeeded"
+                        })
+                        results = retrieval_payload.get("results", []) if isinstance(retrieval_payload, dict) else []
+                        # vector search returns results best first
+                        best_score = float(results[0].get("score", 0.0)) if results else 0.0
+                        if best_score > _RAG_MIN_SCORE:
+                            add_observation(self._format_observation(retrieval_payload))
+                            snippets = "\n".join(
+                                ["- " + (item.get("chunk") or "").strip() for item in results[:3]]
+                            ).strip()
+                            augmented_context = context  # copied only when there is knowledge to add
+                            if snippets:
+                                augmented_context = context + [{
+                                    "role": "system",
+                                    "content": f"Relevant knowledge:\n{snippets}"
+                                }]
+                            rag_answer = self._direct_llm_qa(
+                                query, augmented_context, user_id=user_id, use_cache=use_cache
+                            )
+                    except Exception as e:
+                        logger.error(f"Vector DB retrieval failed: {e}", exc_info=True)
+                        add_tool({
+                            "name": "vdb",
+                            "inputs": {"query": query, "top_k": 3},
+                            "outputs": {"error": str(e)},
+                            "status": "failed"
+                        })
 
-2. PARAMETERS: Pass parameters DIRECTLY in "input" as key-value pairs
-   - Use parameter names from "parameters.properties" schema above
-   - Check "required" array for mandatory parameters
-   - Do NOT nest parameters in "params" or "method" fields
+                answer = rag_answer
+                if not answer:
+                    # nothing observed before and nothing planned after: this answer is the reply
+                    final = not steps and not observations and (step.action == "finish" or not step.decide_next)
+                    stream = on_token if final else None
+                    answer = self._direct_llm_qa(
+                        query, intent_context, user_id=user_id, use_cache=use_cache, on_token=stream
+                    )
+                    run.answer_streamed = stream is not None
+                logger.debug("QA response (%s): %s", intent.name, answer)
 
-EXAMPLES:
+                observation_payload: Dict[str, Any] = {"answer": answer}
+                if retrieval_used and retrieval_payload:
+                    observation_payload["retrieval"] = retrieval_payload
 
-Weather query:
-{{
-  "thought": "User wants weather in Singapore",
-  "action": "weather",
-  "input": {{"location": "Singapore"}},
-  "decide_next": false
-}}
+                step.observation = observation_payload
+                step.status = "succeeded"
+                add_observation(answer)
 
-Email summary:
-{{
-  "thought": "User wants last 5 emails",
-  "action": "gmail",
-  "input": {{"count": 5}},
-  "decide_next": false
-}}
+            add_trace_step(step)
+            add_step(step)
 
-Knowledge search:
-{{
-  "thought": "User wants to search knowledge base about machine learning",
-  "action": "vdb",
-  "input": {{"query": "What is machine learning?", "top_k": 5}},
-  "decide_next": false
-}}
+            should_continue = step.decide_next if step.action != "finish" else False
+            if (
+                step.status in ("finished", "failed")
+                or step.action == "finish"
+                or not should_continue
+            ):
+                done = True
 
-Respond in JSON:
-{{
-  "thought": "your reasoning on what to do next",
-  "action": "tool_name or 'finish'",
-  "input": {{ "param": "value" }},
-  "decide_next": true/false
-}}
-"""
-            steps_context = ""
-            if previous_steps:
-                for i, step in enumerate(previous_steps[-3:], 1):
-                    steps_context += f"{i}. {step.action} ({step.status})\n"
-
-            user_prompt = f"""
-User query: {user_query}
-Current intent: {intent.name}
-Slots: {json.dumps(intent.slots)}
-Previous steps:
-{steps_context}
-Recent observations:
-{observations[-3:] if observations else []}
-"""
+        run.max_rounds_reached = round_count >= self.max_rounds
+        return run
+
+    # =====================================================
+    # === Planning Logic (Step-related)
+    # =====================================================
+
+    def _plan_next_step(
+        self, intent: Intent, user_query: str, previous_steps: List[Step],
+        observations: List[str], context: List[Dict[str, str]], slots_json: Optional[str] = None
+    ) -> Step | List[Step] | None:
+        """Use LLM to plan the next reasoning step (a list of steps for independent tool calls)."""
+        try:
+            system_prompt = self._planner_system_prompt()
+            if slots_json is None:
+                slots_json = _truncate(json.dumps(intent.slots), _MAX_SLOT_CHARS)
+            steps_context = "".join(
+                f"{i}. {step.action} ({step.status})\n" for i, step in enumerate(previous_steps[-3:], 1)
+            )
+            recent_observations = "\n".join(_truncate(o, _MAX_OBS_CHARS) for o in observations[-3:])
+
+            user_prompt = _PLANNER_USER_PROMPT_TEMPLATE.format(
+                query=user_query,
+                intent=intent.name,
+                slots=slots_json,
+                steps=steps_context,
+                observations=recent_observations,
+            )
+
+            cache_key = prompt_hash(
+                "plan",
+                str(self.tools.version),
+                intent.name,
+                slots_json,
+                steps_context,
+                recent_observations,
+            )
+            plan = self._cache_lookup(user_query, cache_key)
+            if plan is not None:
+                logger.info("Planning step served from semantic cache")
+                return self._steps_from_plan(plan, intent)
 
             messages = [
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_prompt},
             ]
-            response = self.llm.chat(messages)
-            return self._parse_planning_response(response, intent)
+            # The system prompt is the static, byte-stable prefix the backend caches; the reply
+            # is streamed and cut off once its plan object is complete
+            response = self.llm.chat_json(
+                messages, prompt_cache_key=f"planner-v{self.tools.version}", schema=_PLAN_STEP_SCHEMA
+            )
+            plan = self._extract_plan(response)
+            if plan is None:
+                return self._fallback_planning(intent)
+            self._cache_store(user_query, cache_key, plan)
+            return self._steps_from_plan(plan, intent)
 
         except Exception as e:
             logger.error(f"Planning failed: {e}", exc_info=True)
             return self._fallback_planning(intent)
 
-    def _parse_planning_response(self, response: str, intent: Intent) -> Optional[Step]:
-        """Parse LLM planning output into a Step object."""
+    def _extract_plan(self, response: str) -> Optional[Dict[str, Any]]:
+        """Extract the planning JSON object from LLM output (None if unparsable)."""
         try:
-            json_str = response.strip()
-            if "```json" in json_str:
-                json_str = json_str.split("```json")[1].split("```")[0].strip()
-            data = json.loads(json_str)
-            return Step(
-                intent=intent.name,
-                thought=data.get("thought", ""),
-                action=data.get("action"),
-                input=data.get("input", {}),
-                observation=None,
-                status="planned",
-                decide_next=bool(data.get("decide_next", True)),
-            )
+            data = None
+            if response.lstrip().startswith("{"):
+                # Bare JSON reply (the usual case): parse directly, no regex scan
+                try:
+                    data = json.loads(response)
+                except json.JSONDecodeError:
+                    pass
+            if data is None:
+                match = _JSON_OBJ_RE.search(response)
+                if match is None:
+                    raise ValueError("no JSON object in planning response")
+                data = json.loads(match.group(1) or match.group(2))
+            if not isinstance(data, dict):
+                raise ValueError("planning response is not a JSON object")
+            return data
         except Exception as e:
             logger.warning(f"Failed to parse planning response: {e}")
-            return self._fallback_planning(intent)
+            return None
+
+    def _step_from_plan(self, data: Dict[str, Any], intent: Intent) -> Step:
+        """Build a fresh Step from a parsed planning payload."""
+        return Step(
+            intent=intent.name,
+            thought=data.get("thought", ""),
+            action=data.get("action"),
+            input=dict(data.get("input") or {}),
+            observation=None,
+            status="planned",
+            decide_next=bool(data.get("decide_next", True)),
+        )
+
+    def _steps_from_plan(self, data: Dict[str, Any], intent: Intent) -> Step | List[Step]:
+        """The Step a plan describes, or one Step per tool call when it lists independent "actions"."""
+        batch = data.get("actions")
+        if not isinstance(batch, list):
+            return self._step_from_plan(data, intent)
+        calls = [a for a in batch if isinstance(a, dict) and a.get("action") not in (None, "", "finish")]
+        if len(calls) == 1 and not data.get("action"):
+            return self._step_from_plan({**data, **calls[0]}, intent)
+        if len(calls) < 2:
+            return self._step_from_plan(data, intent)
+        shared = {"thought": data.get("thought", ""), "decide_next": data.get("decide_next", True)}
+        return [self._step_from_plan({**shared, **call}, intent) for call in calls]
+
+    def _invoke_batch(
+        self, run: IntentRun, intent: Intent, batch: List[Step], user_id: str, session_id: str, memory_used: bool
+    ) -> None:
+        """
+        Invoke a round's independent tool steps concurrently and record them in plan order.
+
+        The calling thread runs the first call itself. A failed call sets
+        run.clarification once the whole batch has been recorded.
+        """
+        calls = []
+        for step in batch:
+            step.memory_used = memory_used
+            if step.action == "memory":
+                if intent.name != "recall_conversation":
+                    logger.warning("LLM tried to call memory tool for intent %s, skipping", intent.name)
+                    step.thought += " | Memory tool skipped (not a recall request)"
+                    step.action = "finish"
+                    step.status = "skipped"
+                    continue
+                step.input.setdefault("user_id", user_id)
+                step.input.setdefault("session_id", session_id)
+            calls.append(step)
+
+        def invoke(step: Step) -> Tuple[Any, Optional[Exception]]:
+            try:
+                return self.tools.invoke(step.action, **step.input), None
+            except Exception as e:
+                return None, e
+
+        logger.debug("Invoking %d independent tool calls for %s", len(calls), intent.name)
+        pending = [self._tool_pool.submit(invoke, step) for step in calls[1:]]
+        outcomes = [invoke(calls[0])] if calls else []
+        outcomes.extend(f.result() for f in pending)
+
+        raised = set()
+        for step, (observation, exc) in zip(calls, outcomes):
+            if exc is not None:
+                step.status = "failed"
+                step.error = str(exc)
+                logger.error("Tool %s invocation raised exception: %s", step.action, exc, exc_info=exc)
+                raised.add(id(step))
+                run.clarification = run.clarification or f"Tool {step.action} failed: {exc}. Retry?"
+                continue
+            step.observation = observation
+            if isinstance(observation, dict) and observation.get("error"):
+                step.status = "failed"
+                step.error = observation.get("error", "Unknown error")
+                logger.info("Tool %s returned error: %s", step.action, step.error)
+                run.clarification = run.clarification or (
+                    f"Tool {step.action} returned an error: {step.error}. Retry?"
+                )
+            else:
+                step.status = "succeeded"
+                run.observations.append(self._format_observation(observation))
+            run.used_tools.append({
+                "name": step.action,
+                "inputs": step.input,
+                "outputs": observation,
+                "status": step.status
+            })
+        run.trace_steps.extend(batch)
+        run.steps.extend(step for step in batch if id(step) not in raised)
+
+    def _is_slot_complete(self, intent: Intent) -> bool:
+        """True if the intent maps to a single tool and all its required slots are filled."""
+        spec = _DIRECT_TOOL_INTENTS.get(intent.name)
+        return spec is not None and all(intent.slots.get(slot) not in (None, "") for slot in spec[1])
+
+    def _direct_step(self, intent: Intent) -> Optional[Step]:
+        """Plan the tool call for a slot-complete single-tool intent without asking the LLM."""
+        if not self._is_slot_complete(intent):
+            return None
+        action, required, optional = _DIRECT_TOOL_INTENTS[intent.name]
+        inputs = {slot: intent.slots[slot] for slot in required}
+        inputs.update({slot: intent.slots[slot] for slot in optional if intent.slots.get(slot) is not None})
+        return Step(
+            intent=intent.name,
+            thought=f"Slots complete: {intent.name} → {action}",
+            action=action,
+            input=inputs,
+            observation=None,
+            status="planned",
+            decide_next=False,
+        )
 
     def _fallback_planning(self, intent: Intent) -> Step:
         """Fallback when planning fails."""
-        mapping = {
-            "get_weather": ("weather", {"city": intent.slots.get("location", "Singapore")}),
-            "summarize_emails": ("gmail", {"count": intent.slots.get("count", 5)}),
-            "query_knowledge": ("vdb", {"query": intent.slots.get("query", "")}),
-            "general_qa": (None, {"query": intent.slots.get("query", "")}),
-            "recall_conversation": ("memory", {"query": intent.slots.get("query", "")}),
-        }
-        action, inputs = mapping.get(intent.name, (None, {"query": ""}))
-        inputs = {k: v for k, v in inputs.items() if v}
+        action, input_key, slot, default = _FALLBACK_ACTIONS.get(intent.name, (None, "query", None, ""))
+        value = intent.slots.get(slot, default) if slot else default
+        inputs = {input_key: value} if value else {}
         return Step(
             intent=intent.name,
             thought=f"Fallback planning: {intent.name} → {action or 'direct LLM'}",
@@ -783,6 +1460,115 @@ Recent observations:
             decide_next=False,
         )
 
+    # =====================================================
+    # === Semantic Cache Helpers
+    # =====================================================
+
+    def _cache_lookup(self, text: str, key: int) -> Optional[Any]:
+        """Look up a semantically-near cached LLM result (never raises)."""
+        if self.llm_cache is None:
+            return None
+        try:
+            return self.llm_cache.lookup(text, key)
+        except Exception as e:
+            logger.warning(f"Semantic cache lookup failed: {e}")
+            return None
+
+    def _cache_store(self, text: str, key: int, value: Any) -> None:
+        """Store an LLM result in the semantic cache (never raises)."""
+        if self.llm_cache is None:
+            return
+        try:
+            self.llm_cache.store(text, key, value)
+        except Exception as e:
+            logger.warning(f"Semantic cache store failed: {e}")
+
+    def _embed(self, text: str) -> np.ndarray:
+        """Embedding of text from the per-Agent LRU (computed at most once while cached)."""
+        return self._embed_texts([text])[0]
+
+    def _embed_texts(self, texts: List[str]) -> List[np.ndarray]:
+        """Batch variant of _embed: cache misses are embedded in a single encoder call."""
+        with self._embedding_lock:
+            found = {t: self._embedding_cache.get(t) for t in texts}
+            for t, vec in found.items():
+                if vec is not None:
+                    self._embedding_cache.move_to_end(t)
+        missing = [t for t, vec in found.items() if vec is None]
+        if missing:
+            for t, raw in zip(missing, self._embed_fn(missing)):
+                vec = np.asarray(raw, dtype=np.float32)
+                vec.flags.writeable = False  # shared by every caller
+                found[t] = vec
+            with self._embedding_lock:
+                for t in missing:
+                    self._embedding_cache[t] = found[t]
+                while len(self._embedding_cache) > _EMBEDDING_CACHE_SIZE:
+                    self._embedding_cache.popitem(last=False)
+        return [found[t] for t in texts]
+
+    def _cached_answer(
+        self,
+        user_query: str,
+        key: int,
+        messages: List[Dict[str, str]],
+        use_cache: bool,
+        on_token: Optional[Callable[[str], None]] = None,
+        prompt_cache_key: Optional[str] = None,
+    ) -> str:
+        """
+        Return the cached answer for the same query in the same scope, else ask the LLM.
+
+        Callers put the user and the normalized query text in `key`: queries that
+        differ only in a number, city or date embed almost identically, so
+        similarity alone would hand back a confidently wrong answer.
+        """
+        if not use_cache or self.answer_cache is None:
+            return self._chat(messages, on_token, prompt_cache_key)
+        cached = self._lookup_answer(user_query, key)
+        if cached is not None:
+            logger.info("Answer served from cache")
+            if on_token is not None:
+                on_token(cached)
+            return cached
+        answer = self._chat(messages, on_token, prompt_cache_key)
+        if answer and not answer.startswith("Error:"):  # provider errors come back as text
+            self._store_answer(user_query, key, answer)
+        return answer
+
+    def _lookup_answer(self, user_query: str, key: int) -> Optional[Any]:
+        """Answer-cache entry stored for key and this (normalized) query, if any."""
+        try:
+            return self.answer_cache.lookup(_normalize_query(user_query), key)
+        except Exception as e:
+            logger.warning(f"Answer cache lookup failed: {e}")
+            return None
+
+    def _store_answer(self, user_query: str, key: int, value: Any, ttl: Optional[float] = None) -> None:
+        try:
+            self.answer_cache.store(_normalize_query(user_query), key, value, ttl=ttl)
+        except Exception as e:
+            logger.warning(f"Answer cache store failed: {e}")
+
+    def _chat(
+        self,
+        messages: List[Dict[str, str]],
+        on_token: Optional[Callable[[str], None]] = None,
+        prompt_cache_key: Optional[str] = None,
+    ) -> str:
+        """llm.chat, or stream the reply through on_token and return it joined (errors become 'Error: ...')."""
+        if on_token is None:
+            return self.llm.chat(messages, prompt_cache_key=prompt_cache_key)
+        chunks: List[str] = []
+        try:
+            for chunk in self.llm.chat_stream(messages, prompt_cache_key=prompt_cache_key):
+                chunks.append(chunk)
+                on_token(chunk)
+        except Exception as e:
+            logger.error("Streaming chat failed after %d chunks: %r", len(chunks), e)
+            return f"Error: {e}"
+        return "".join(chunks)
+
     # =====================================================
     # === Summarization & Helpers
     # =====================================================
@@ -814,75 +1600,59 @@ Recent observations:
 
     def _append_citation_block(self, answer: str, citations: List[Dict[str, Any]]) -> str:
         """Append formatted citation block to the final answer."""
-        unique: List[Tuple[str, Any]] = []
-        seen = set()
-        for citation in citations:
-            filename = citation.get("filename")
-            page = citation.get("page")
-            key = (filename, page)
-            if not filename or key in seen:
-                continue
-            seen.add(key)
-            unique.append((filename, page))
-
+        # dict.fromkeys dedupes (filename, page) pairs in first-seen order
+        unique = dict.fromkeys(
+            (citation.get("filename"), citation.get("page")) for citation in citations if citation.get("filename")
+        )
         if not unique:
             return answer
 
-        lines = []
-        for idx, (filename, page) in enumerate(unique, 1):
-            page_display = page if page not in (None, "") else "?"
-            lines.append(f"{idx}. {filename}, page {page_display}")
-
-        return answer.rstrip() + "\n\nSource:\n" + "\n".join(lines)
+        # the answer, header and numbered sources are joined in a single pass
+        lines = [f"{answer.rstrip()}\n\nSource:"]
+        lines.extend(
+            f"{idx}. {filename}, page {page if page not in (None, '') else '?'}"
+            for idx, (filename, page) in enumerate(unique, 1)
+        )
+        return "\n".join(lines)
 
     def _format_observation(self, observation: Any) -> str:
         """Format tool output for readability."""
         if isinstance(observation, dict):
-            if observation.get("scope") == "longterm" and isinstance(observation.get("results"), list):
-                if not observation["results"]:
+            # the keys every branch tests are read once
+            scope = observation.get("scope")
+            results = observation.get("results")
+            if scope == "longterm" and isinstance(results, list):
+                if not results:
                     return "No prior conversation found."
-                formatted = []
-                for idx, item in enumerate(observation["results"][:3], 1):
-                    if isinstance(item, dict):
-                        snippet = item.get("chunk") or item.get("text") or json.dumps(item, ensure_ascii=False)
-                    else:
-                        snippet = str(item)
-                    snippet = (snippet or "").strip().replace("\n", " ")
-                    if len(snippet) > 200:
-                        snippet = snippet[:200].rstrip() + "..."
-                    formatted.append(f"{idx}. {snippet}")
+                formatted = [f"{idx}. {_result_snippet(item)}" for idx, item in enumerate(results[:3], 1)]
                 return "Conversation recall:\n" + "\n".join(formatted)
-            if observation.get("scope") == "knowledge" and observation.get("fallback_answer"):
+            if scope == "knowledge" and observation.get("fallback_answer"):
                 return "Knowledge search returned no results. LLM answer: " + observation["fallback_answer"]
-            if "results" in observation and isinstance(observation["results"], list):
-                results_list = observation["results"]
-                if not results_list:
+            if isinstance(results, list):
+                if not results:
                     return "No relevant results found."
                 formatted = []
-                max_items = min(len(results_list), 10)
-                for idx, item in enumerate(results_list[:max_items], 1):
-                    if isinstance(item, dict):
-                        title = item.get("metadata", {}).get("title") if isinstance(item.get("metadata"), dict) else None
-                        snippet = item.get("chunk") or item.get("text") or json.dumps(item, ensure_ascii=False)
-                    else:
-                        title = None
-                        snippet = str(item)
-                    snippet = (snippet or "").strip().replace("\n", " ")
-                    if len(snippet) > 200:
-                        snippet = snippet[:200].rstrip() + "..."
+                for idx, item in enumerate(results[:10], 1):
+                    metadata = item.get("metadata") if isinstance(item, dict) else None
+                    title = metadata.get("title") if isinstance(metadata, dict) else None
+                    snippet = _result_snippet(item)
                     if title:
                         formatted.append(f"{idx}. {title}: {snippet}")
                     else:
                         formatted.append(f"{idx}. {snippet}")
                 return "Knowledge hits:\n" + "\n".join(formatted)
-            if "temperature" in observation:
+            temperature = observation.get("temperature")
+            if temperature is not None:
                 loc = observation.get("location", "")
-                return f"Weather in {loc}: {observation['temperature']}°C, {observation.get('condition', '')}"
+                return f"Weather in {loc}: {temperature}°C, {observation.get('condition', '')}"
             return str(observation)
         return str(observation)[:300]
 
-    def _direct_llm_qa(self, user_query: str, context: List[Dict[str, str]]) -> str:
-        """Direct QA mode (no tool invocation)."""
+    def _direct_llm_qa(
+        self, user_query: str, context: List[Dict[str, str]], user_id: str = "", use_cache: bool = True,
+        on_token: Optional[Callable[[str], None]] = None,
+    ) -> str:
+        """Direct QA mode (no tool invocation); cached per user, query and context, streamed to on_token."""
         try:
             # Check if context contains memory information
             has_memory = any(
@@ -891,60 +1661,64 @@ Recent observations:
                 for msg in context
             )
             
-            if has_memory:
-                system_prompt = """You are a helpful assistant that answers questions based on retrieved conversation history.
-
-IMPORTANT: The "Previous memory:" or "Conversation recall:" section contains information that the user previously provided or discussed.
-You should use this information to answer the user's question directly and accurately.
-- If the memory contains the requested information, provide it clearly
-- Do NOT refuse to share information that was retrieved from the user's own conversation history
-- The user is asking you to recall information they previously told you, so you should share it
-
-Answer naturally and clearly in the same language as the user."""
+            # Fixed instructions from module constants: the byte-stable prefix the backend caches
+            system_prompt, prompt_name = (_QA_MEMORY_PROMPT, "qa-memory") if has_memory else (_QA_PROMPT, "qa")
+
+            recent_context = _budget_context(context)
+            # Memory / knowledge blocks join the one system message after its fixed instructions,
+            # which stay a byte-stable prefix for the provider's prompt cache
+            notes = [msg["content"] for msg in recent_context if msg.get("role") == "system"]
+            if notes:
+                messages = [{"role": "system", "content": "\n\n".join([system_prompt, *notes])}]
+                messages += [msg for msg in recent_context if msg.get("role") != "system"]
             else:
-                system_prompt = (
-                    "You are a helpful assistant. Answer naturally and clearly in the same language as the user."
-                )
-            
-            messages = [{"role": "system", "content": system_prompt}]
-            messages += context[-6:]
+                messages = [{"role": "system", "content": system_prompt}, *recent_context]
             messages.append({"role": "user", "content": user_query})
-            return self.llm.chat(messages)
+            cache_key = prompt_hash(
+                "qa", self.llm.provider, user_id, _normalize_query(user_query), system_prompt, json.dumps(recent_context)
+            )
+            return self._cached_answer(user_query, cache_key, messages, use_cache, on_token, prompt_name)
         except Exception as e:
             logger.error(f"Direct QA failed: {e}", exc_info=True)
             return f"Sorry, an error occurred: {e}"
 
-    def _summarize_result(self, user_query: str, steps: List[Step], observations: List[str]) -> str:
-        """Use LLM to summarize final answer."""
+    def _summarize_result(
+        self,
+        user_query: str,
+        steps: List[Step],
+        observations: List[str],
+        user_id: str = "",
+        use_cache: bool = True,
+        on_token: Optional[Callable[[str], None]] = None,
+    ) -> str:
+        """Use LLM to summarize final answer (semantically cached per user and observations; streamed to on_token)."""
         if not observations:
             return "I couldn't find relevant information for your question."
+        # A lone direct-QA answer is already the reply; summarizing it would only paraphrase it
+        if len(observations) == 1 and len(steps) == 1:
+            observation = steps[0].observation
+            if isinstance(observation, dict) and observation.get("answer") == observations[0]:
+                if on_token is not None:
+                    on_token(observations[0])
+                return observations[0]
         
         # Check if we have memory recall in observations
         has_memory_recall = any("Conversation recall:" in obs or "Previous memory:" in obs for obs in observations)
         
         # Adjust system prompt based on whether we have memory recall
-        if has_memory_recall:
-            system_prompt = """You are a helpful assistant that answers questions based on retrieved conversation history.
-
-IMPORTANT: The "Conversation recall:" section contains information that the user previously provided or discussed. 
-You should use this information to answer the user's question directly and accurately.
-- If the recall contains the requested information, provide it clearly
-- Do NOT refuse to share information that was retrieved from the user's own conversation history
-- The user is asking you to recall information they previously told you, so you should share it
-
-Combine the gathered information into a clear, natural answer that addresses the user's query."""
-        else:
-            system_prompt = (
-                "You are a helpful assistant. Combine the gathered information into a clear, natural summary."
-            )
-        
+        system_prompt, prompt_name = (
+            (_SUMMARY_MEMORY_PROMPT, "summary-memory") if has_memory_recall else (_SUMMARY_PROMPT, "summary")
+        )
         summary_context = f"User query: {user_query}\n\n" + "\n".join(observations[-5:])
         messages = [
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": summary_context},
         ]
+        cache_key = prompt_hash(
+            "summary", self.llm.provider, user_id, _normalize_query(user_query), system_prompt, summary_context
+        )
         try:
-            return self.llm.chat(messages)
+            return self._cached_answer(user_query, cache_key, messages, use_cache, on_token, prompt_name)
         except Exception as e:
             logger.error(f"Summarization failed: {e}", exc_info=True)
             return self._format_fallback_answer(user_query, observations)
@@ -956,9 +1730,15 @@ Combine the gathered information into a clear, natural answer that addresses the
         return "Based on the gathered information:\n" + "\n".join(f"- {obs}" for obs in observations[-5:])
 
     def _merge_context(self, short_context: List[Dict[str, str]], longterm_context: List[Dict[str, Any]]):
-        """Merge short-term context with semantic long-term memory."""
-        merged = list(short_context)
-        if longterm_context:
-            memory_summary = "\n".join([f" Previous memory: {c['chunk']}" for c in longterm_context])
-            merged.append({"role": "system", "content": memory_summary})
-        return merged
+        """Merge short-term context with distinct long-term memories (each capped at _MAX_MEMORY_CHARS)."""
+        # the same memory stored twice (e.g. a fact repeated across turns) is merged once
+        chunks: Dict[str, str] = {}
+        for c in longterm_context:
+            if c.get("chunk"):
+                chunks.setdefault(_normalize_query(c["chunk"]).lower(), c["chunk"])
+        if not chunks:
+            return short_context
+        memory_summary = "\n".join(
+            f" Previous memory: {_truncate(chunk, _MAX_MEMORY_CHARS)}" for chunk in chunks.values()
+        )
+        return short_context + [{"role": "system", "content": memory_summary}]
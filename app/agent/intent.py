@@ -5,12 +5,13 @@
 
 from dataclasses import dataclass
 from typing import Dict, Any, Optional, List, Union
-import json
 import logging
 import re
+
+from app.utils import serialization as json
         
 
-@dataclass
+@dataclass(slots=True)
 class Intent:
     name: str
     slots: Dict[str, Any]
@@ -20,6 +21,18 @@ class Intent:
     clarification_prompt: Optional[str] = None
     memory_hint: bool = False
 
+    def to_dict(self) -> Dict[str, Any]:
+        """Shallow dict of all fields; cheaper than dataclasses.asdict on hot paths."""
+        return {
+            "name": self.name,
+            "slots": self.slots,
+            "confidence": self.confidence,
+            "priority": self.priority,
+            "needs_confirmation": self.needs_confirmation,
+            "clarification_prompt": self.clarification_prompt,
+            "memory_hint": self.memory_hint,
+        }
+
 
 class IntentRecognizer:
     """
@@ -59,9 +72,9 @@ class IntentRecognizer:
             # Build context string from conversation history
             context_str = ""
             if context:
-                context_str = "\nConversation history:\n"
-                for msg in context[-3:]:  # Last 3 turns
-                    context_str += f"{msg.get('role', 'user')}: {msg.get('content', '')}\n"
+                context_str = "\nConversation history:\n" + "".join(
+                    f"{msg.get('role', 'user')}: {msg.get('content', '')}\n" for msg in context[-3:]  # Last 3 turns
+                )
 
             # Create structured JSON prompt for LLM
             system_prompt = """You are an intent recognition assistant. Analyze the user's query and return a JSON response.
@@ -3,61 +3,145 @@
 # ShortTermMemory / SessionMemory Management
 # =====================================================
 
-from typing import List, Dict, Any
+from collections import OrderedDict, deque
+import hashlib
+import threading
+from typing import List, Dict, Any, Deque, Optional, Sequence, Tuple
 import uuid
 from app.memory.sqlite_store import SQLiteStore
 from app.memory.vector_store import VectorStore
-from app.utils.config import LONGTERM_PATH
+from app.utils.config import LONGTERM_PATH, settings
+from app.utils import serialization as json
+
+# Sessions whose values SessionMemory keeps decoded in RAM (LRU)
+_SESSION_CACHE_SIZE = 1024
+_MISSING = object()  # cache-miss sentinel (None is a cacheable "no such key")
+
+# Digests of recently stored long-term messages (LRU) used to skip re-embedding repeats
+_SEEN_MESSAGES_SIZE = 10_000
 
 
 class ShortTermMemory:
     """
     Purely in-RAM buffer for recent conversation turns.
+
+    Backed by a bounded deque so `add` evicts the oldest turn in O(1).
+    `get_context` returns a snapshot list that is rebuilt only after the
+    buffer changes; callers must treat it as read-only. The lock keeps a
+    snapshot taken by one turn from outliving an append made by another.
     """
 
     def __init__(self, limit: int = 5):
-        self.buffer: List[Dict[str, str]] = []
+        self.buffer: Deque[Dict[str, str]] = deque(maxlen=limit)
         self.limit = limit
+        self._snapshot: Optional[List[Dict[str, str]]] = None
+        self._lock = threading.Lock()
 
     def add(self, role: str, content: str):
-        self.buffer.append({"role": role, "content": content})
-        if len(self.buffer) > self.limit:
-            self.buffer.pop(0)
+        with self._lock:
+            self.buffer.append({"role": role, "content": content})
+            self._snapshot = None
 
     def get_context(self) -> List[Dict[str, str]]:
-        return list(self.buffer)
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._lock:
+                if self._snapshot is None:
+                    self._snapshot = list(self.buffer)
+                snapshot = self._snapshot
+        return snapshot
 
     def clear(self):
-        self.buffer.clear()
+        with self._lock:
+            self.buffer.clear()
+            self._snapshot = None
 
 
 class SessionMemory:
     """
     Persistent context via SQLite.
+
+    Values are mirrored in a per-session write-through cache, so a session
+    read after this process wrote it skips both the SQLite query and the JSON
+    parse. Dicts and lists are stored as JSON but cached (and returned) as the
+    original objects, which callers must treat as read-only. Values written
+    with a TTL are not cached. The cache assumes this instance is the only
+    writer of its sessions.
     """
 
     def __init__(self, store: SQLiteStore):
         self.store = store
+        self._cache: "OrderedDict[Tuple[str, str], Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Held across each SQLite access and its cache update so a cache fill never races a write
+        self._store_lock = threading.Lock()
+
+    @staticmethod
+    def _encode(value: Any) -> str:
+        return json.dumps(value) if isinstance(value, (dict, list)) else str(value)
+
+    def _cache_put(self, user_id: str, session_id: str, values: Dict[str, Any]):
+        with self._lock:
+            cached = self._cache.get((user_id, session_id))
+            if cached is None:
+                cached = self._cache[(user_id, session_id)] = {}
+                if len(self._cache) > _SESSION_CACHE_SIZE:
+                    self._cache.popitem(last=False)
+            else:
+                self._cache.move_to_end((user_id, session_id))
+            cached.update(values)
+
+    def _cached(self, user_id: str, session_id: str, key: str) -> Any:
+        with self._lock:
+            cached = self._cache.get((user_id, session_id))
+            if cached is None or key not in cached:
+                return _MISSING
+            self._cache.move_to_end((user_id, session_id))
+            return cached[key]
+
+    def _cache_drop(self, user_id: str, session_id: str, keys: Sequence[str]):
+        with self._lock:
+            cached = self._cache.get((user_id, session_id))
+            if cached is not None:
+                for key in keys:
+                    cached.pop(key, None)
 
     def write(self, user_id: str, session_id: str, key: str, value: Any, ttl: int | None = None):
         """
-        Write session data to persistent storage.
+        Write session data to persistent storage, replacing the key's previous value.
         
         Args:
             user_id: User identifier
             session_id: Session identifier (used as namespace)
             key: Key/type of data being stored
-            value: Value to store (will be converted to string)
+            value: Value to store (dicts/lists as JSON, anything else converted to string)
             ttl: Time-to-live in seconds (None = no expiration)
         """
-        if value is None:
-            self.store.delete(user_id, session_id, key)
-            return
-        self.store.write(user_id, session_id, key, str(value), ttl)
+        self.write_many(user_id, session_id, {key: value}, ttl)
+
+    def write_many(self, user_id: str, session_id: str, pairs: Dict[str, Any], ttl: int | None = None):
+        """
+        Write several session keys in one transaction (each replaces its previous value).
+
+        Args:
+            user_id: User identifier
+            session_id: Session identifier (used as namespace)
+            pairs: Mapping of key -> value (None deletes the key)
+            ttl: Time-to-live in seconds applied to every written value
+        """
+        with self._store_lock:
+            self.store.write_many(
+                (user_id, session_id, key, None if value is None else self._encode(value), ttl)
+                for key, value in pairs.items()
+            )
+            if ttl is None:
+                self._cache_put(user_id, session_id, pairs)
+            else:
+                self._cache_drop(user_id, session_id, list(pairs))
 
     def read(self, user_id: str, session_id: str, key: str):
         """
-        Read session data from persistent storage.
+        Read session data from the cache, falling back to persistent storage.
         
         Args:
             user_id: User identifier
@@ -65,21 +149,32 @@ class SessionMemory:
             key: Key/type of data to retrieve
             
         Returns:
-            Content of the first matching record or None
+            The cached value, else the content of the first matching record, or None
         """
-        results = self.store.read(user_id, session_id)
-        if isinstance(results, list):
-            for record in results:
-                if record.get("type") == key:
-                    return record.get("content")
-        return None
+        cached = self._cached(user_id, session_id, key)
+        if cached is not _MISSING:
+            return cached
+        with self._store_lock:
+            cached = self._cached(user_id, session_id, key)
+            if cached is not _MISSING:
+                return cached
+            content = None
+            ttl = 0
+            results = self.store.read(user_id, session_id)
+            if isinstance(results, list):
+                for record in results:
+                    if record.get("type") == key:
+                        content, ttl = record.get("content"), record.get("ttl")
+                        break
+            if not ttl:
+                self._cache_put(user_id, session_id, {key: content})
+        return content
 
     def to_longterm_snapshot(self, user_id: str, session_id: str) -> List[Dict[str, Any]]:
         """Extract the latest conversation context for long-term storage."""
         context = self.read(user_id, session_id, "context")
         if not context:
             return []
-        import json
         try:
             parsed = json.loads(context) if isinstance(context, str) else context
             return parsed.get("conversation_history", [])
@@ -88,11 +183,10 @@ class SessionMemory:
 
     def clear(self, user_id: str, session_id: str):
         """Clear all records under this session_id."""
-        import sqlite3
-        conn = sqlite3.connect(self.store.path)
-        conn.execute("DELETE FROM memories WHERE user_id=? AND namespace=?", (user_id, session_id))
-        conn.commit()
-        conn.close()
+        with self._store_lock:
+            self.store.clear_namespace(user_id, session_id)
+            with self._lock:
+                self._cache.pop((user_id, session_id), None)
 
 # =====================================================
 # 🔹 Long-Term Memory Wrapper
@@ -110,23 +204,44 @@ class LongTermMemoryStore:
     def __init__(self):
         self.vstore = VectorStore(
             path=LONGTERM_PATH,
-            collection="longterm_mem"
+            collection="longterm_mem",
+            quantize=settings.LONGTERM_INT8_VECTORS,
+            hnsw_params={
+                "M": settings.LONGTERM_HNSW_M,
+                "construction_ef": settings.LONGTERM_HNSW_EF_CONSTRUCTION,
+                "search_ef": settings.LONGTERM_HNSW_EF_SEARCH,
+            },
         )
+        # (user, session, role, content) digests already stored; a repeat (e.g. a retried
+        # turn) adds nothing to recall, so it is skipped before it reaches the embedder
+        self._seen: "OrderedDict[bytes, None]" = OrderedDict()
+
+    @staticmethod
+    def _message_digest(user_id: str, session_id: str, role: str, text: str) -> bytes:
+        return hashlib.blake2b("\x1f".join((user_id, session_id, role, text)).encode("utf-8"), digest_size=16).digest()
 
     def store_conversation(self, user_id: str, session_id: str, messages: List[Dict], start_index: int = 0):
         """
         Convert and store conversation messages into long-term memory.
 
+        Messages this store has already saved for the same user, session and
+        role are skipped (tracked for the last _SEEN_MESSAGES_SIZE messages).
+
         Args:
             user_id: Unique user identifier
             session_id: Session identifier
             messages: List of dicts with "role" and "content"
         """
         docs = []
+        digests = {}  # insertion-ordered; recorded as seen only once the batch is stored
         for offset, m in enumerate(messages):
             text = m.get("content", "")
             if not text:
                 continue
+            digest = self._message_digest(user_id, session_id, m.get("role", "user"), text)
+            if digest in self._seen or digest in digests:
+                continue
+            digests[digest] = None
             docs.append({
                 "id": f"{user_id}_{session_id}_{start_index + offset}_{uuid.uuid4().hex}",
                 "text": text,
@@ -139,12 +254,29 @@ class LongTermMemoryStore:
             })
         if docs:
             self.vstore.ingest(docs)
+        for digest in digests:
+            self._seen[digest] = None
+            if len(self._seen) > _SEEN_MESSAGES_SIZE:
+                self._seen.popitem(last=False)
 
     def clear_all(self) -> None:
         """Delete all stored long-term conversation data."""
         self.vstore.delete_all()
+        self._seen.clear()
+
+    @property
+    def embedding_cache_info(self):
+        """Hit/miss counters of the query embedding cache (see VectorStore.embed_query)."""
+        return self.vstore.query_cache_info()
 
-    def search(self, query: str, top_k: int = 3, user_id: str | None = None, session_id: str | None = None) -> List[Dict]:
+    def search(
+        self,
+        query: str,
+        top_k: int = 3,
+        user_id: str | None = None,
+        session_id: str | None = None,
+        query_emb: Sequence[float] | None = None,
+    ) -> List[Dict]:
         """
         Query the long-term memory for semantically related content.
 
@@ -153,6 +285,7 @@ class LongTermMemoryStore:
             top_k: Maximum number of results to return
             user_id: Optional user identifier used to scope results
             session_id: Optional session identifier for additional scoping
+            query_emb: Precomputed embedding of query (skips re-embedding)
 
         Returns:
             A list of relevant memory chunks.
@@ -164,4 +297,4 @@ class LongTermMemoryStore:
             where = {"user_id": user_id}
         elif session_id:
             where = {"session_id": session_id}
-        return self.vstore.query(query, top_k, where=where)
+        return self.vstore.query(query, top_k, where=where, query_embedding=query_emb)
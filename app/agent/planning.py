@@ -3,13 +3,14 @@
 # Step and PlanTrace data models for reasoning trace
 # =====================================================
 
-from dataclasses import dataclass, field, asdict
+from dataclasses import dataclass, field
 from typing import Any, Dict, List, Optional
 from datetime import datetime
-import json
 
+from app.utils import serialization as json
 
-@dataclass
+
+@dataclass(slots=True)
 class Step:
     """Represents a single reasoning or action step in the ReAct loop."""
     intent: str
@@ -27,18 +28,66 @@ class Step:
         """Return True if this step ends the reasoning process."""
         return self.status in ("finished", "failed") or not self.decide_next
 
+    def to_dict(self) -> Dict[str, Any]:
+        """Shallow dict of all fields; cheaper than dataclasses.asdict on hot paths."""
+        return {
+            "intent": self.intent,
+            "thought": self.thought,
+            "action": self.action,
+            "input": self.input,
+            "observation": self.observation,
+            "status": self.status,
+            "decide_next": self.decide_next,
+            "error": self.error,
+            "memory_used": self.memory_used,
+            "timestamp": self.timestamp,
+        }
+
+
+@dataclass(slots=True)
+class IntentRun:
+    """Outcome of the ReAct loop for a single intent, merged by the orchestrator."""
+    intent: str
+    steps: List[Step] = field(default_factory=list)
+    trace_steps: List[Step] = field(default_factory=list)
+    used_tools: List[Dict[str, Any]] = field(default_factory=list)
+    observations: List[str] = field(default_factory=list)
+    clarification: Optional[str] = None  # set when a tool failed and the user must decide
+    max_rounds_reached: bool = False
+    answer_streamed: bool = False  # its direct-QA answer already went to the turn's on_token
+
 
 class PlanTrace:
     """Tracks the full execution trace of an agent reasoning session."""
+    __slots__ = ("user_query", "steps", "created_at", "_rows")
+
     def __init__(self, user_query: str):
         self.user_query = user_query
         self.steps: List[Step] = []
         self.created_at = datetime.utcnow().isoformat()
+        self._rows: Dict[int, Dict[str, Any]] = {}  # id(step) -> serialized step
 
     def add_step(self, step: Step):
         """Append a new reasoning step to the trace."""
         self.steps.append(step)
 
+    def step_rows(self, steps: Optional[List[Step]] = None) -> List[Dict[str, Any]]:
+        """
+        Serialized steps, converting each Step at most once per trace.
+
+        `steps` defaults to the whole trace; pass a subset of the traced steps
+        (e.g. only the successful ones) to reuse the same rows. Steps must not
+        be mutated after their first serialization.
+        """
+        rows = self._rows
+        out = []
+        for s in self.steps if steps is None else steps:
+            row = rows.get(id(s))
+            if row is None:
+                row = rows[id(s)] = s.to_dict()
+            out.append(row)
+        return out
+
     def summarize(self) -> str:
         """Human-readable summary of reasoning steps."""
         summary_lines = [f"Plan Trace for: {self.user_query}"]
@@ -46,10 +95,10 @@ class PlanTrace:
             obs_preview = ""
             if s.observation:
                 if isinstance(s.observation, dict):
-                    obs_preview = json.dumps(s.observation, ensure_ascii=False)[:80]
+                    obs_preview = json.dumps(s.observation)[:80]
                 else:
                     obs_preview = str(s.observation)[:80]
-            memory_note = " | 🧠 used memory" if getattr(s, "memory_used", False) else ""
+            memory_note = " | 🧠 used memory" if s.memory_used else ""
             summary_lines.append(
                 f"Step {i}: [{s.status.upper()}] {s.intent} → {s.action or 'None'} | "
                 f"Thought: {s.thought[:60]} | Obs: {obs_preview}{memory_note}"
@@ -61,9 +110,10 @@ class PlanTrace:
         return {
             "user_query": self.user_query,
             "created_at": self.created_at,
-            "steps": [asdict(s) for s in self.steps],
+            "steps": self.step_rows(),
         }
 
     def clear(self):
         """Reset the trace."""
         self.steps.clear()
+        self._rows.clear()
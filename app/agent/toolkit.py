@@ -21,6 +21,7 @@ class ToolRegistry:
             tools: Mapping of tool name → adapter instance
         """
         self.tools = tools or {}
+        self.version = 0  # bumped on register/unregister so cached descriptions can be refreshed
         logger.info(f"Initialized ToolRegistry with tools: {list(self.tools.keys())}")
 
     # -----------------------------------------------------
@@ -67,7 +68,7 @@ class ToolRegistry:
             return {"error": f"Unknown tool: {tool_name}"}
 
         tool = self.tools[tool_name]
-        logger.info(f"Invoking tool '{tool_name}' with params: {kwargs}")
+        logger.info("Invoking tool '%s' with params: %s", tool_name, kwargs)
 
         call_kwargs = dict(kwargs)
         method_override = call_kwargs.pop("method", None)
@@ -85,7 +86,7 @@ class ToolRegistry:
         for candidate in candidate_methods:
             if hasattr(tool, candidate) and callable(getattr(tool, candidate)):
                 method = getattr(tool, candidate)
-                logger.debug(f"Tool '{tool_name}' using method '{candidate}' with args: {call_kwargs}")
+                logger.debug("Tool '%s' using method '%s' with args: %s", tool_name, candidate, call_kwargs)
                 break
 
         if not method:
@@ -112,10 +113,12 @@ class ToolRegistry:
     def register(self, name: str, tool_instance: Any):
         """Dynamically register a new tool."""
         self.tools[name] = tool_instance
+        self.version += 1
         logger.info(f"Registered new tool: {name}")
 
     def unregister(self, name: str):
         """Remove a tool from registry."""
         if name in self.tools:
             del self.tools[name]
+            self.version += 1
             logger.info(f"Unregistered tool: {name}")
@@ -1,11 +1,10 @@
-import json
 from fastapi import APIRouter, Depends
 
 from app.security.auth import require_bearer
 from app.tools.vdb import KnowledgeBaseStore
 from app.agent.memory import LongTermMemoryStore
-from app.memory.sqlite_store import SQLiteStore
 from app.api.agent import agent as running_agent
+from app.utils import serialization as json
 
 router = APIRouter()
 
@@ -18,24 +17,26 @@ async def reset_all_data(user=Depends(require_bearer)):
     longterm_store = LongTermMemoryStore()
     longterm_store.clear_all()
 
-    SQLiteStore().clear_all()
-
     # Clear in-memory caches held by the running agent instance
     running_agent.short_mem.clear()
     running_agent.mem.clear_all()
+    running_agent.wait_for_persistence()  # don't let a queued write repopulate the store
     running_agent.longterm_mem.clear_all()
     vdb_adapter = running_agent.tools.tools.get("vdb")
     if vdb_adapter and hasattr(vdb_adapter, "store"):
         vdb_adapter.store.clear_all()
     running_agent.session_mem = running_agent.session_mem.__class__(running_agent.mem)
+    if running_agent.llm_cache is not None:
+        running_agent.llm_cache.clear()
+    if running_agent.answer_cache is not None:
+        running_agent.answer_cache.clear()
 
     return {"status": "ok", "detail": "All knowledge, long-term, and session data cleared."}
 
 
 @router.get("/bootstrap")
 async def bootstrap_state(user=Depends(require_bearer)):
-    store = SQLiteStore()
-    sessions_raw = store.list_session_contexts(user["user_id"])
+    sessions_raw = running_agent.mem.list_session_contexts(user["user_id"])
     sessions = []
 
     for idx, entry in enumerate(sessions_raw, start=1):
@@ -1,7 +1,10 @@
 ﻿from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 from app.security.auth import require_bearer
 from app.schemas.models import AgentInvokeRequest, AgentResponse
 from app.agent.core import Agent
+from app.utils import serialization as json
+import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
@@ -10,6 +13,26 @@ router = APIRouter()
 agent = Agent()
 
 
+def _to_response(result, secure_mode: bool) -> AgentResponse:
+    """Normalize an Agent result dict to the AgentResponse schema."""
+    if not isinstance(result, dict):
+        logger.warning("Agent returned non-dict result; coercing to dict")
+        result = {"answer": str(result)}
+
+    return AgentResponse(
+        type=result.get("type", "answer"),
+        answer=result.get("answer", ""),
+        intents=result.get("intents", []),
+        steps=result.get("steps", []),
+        used_tools=result.get("used_tools", []),
+        citations=result.get("citations", []),
+        message=result.get("message"),
+        options=result.get("options"),
+        secure_mode=result.get("secure_mode", secure_mode),
+        masked_input=result.get("masked_input"),
+    )
+
+
 @router.post("/invoke", response_model=AgentResponse)
 async def invoke(req: AgentInvokeRequest, user=Depends(require_bearer)):
     """
@@ -30,8 +53,8 @@ async def invoke(req: AgentInvokeRequest, user=Depends(require_bearer)):
             f"input={req.input[:100]}"
         )
 
-        # === Call core agent logic ===
-        result = agent.handle(
+        # === Call core agent logic (off the event loop) ===
+        result = await agent.ahandle(
             user_id=user["user_id"],
             text=req.input,
             session_id=req.session_id,
@@ -39,24 +62,7 @@ async def invoke(req: AgentInvokeRequest, user=Depends(require_bearer)):
         )
 
         # === Normalize response to fit AgentResponse schema ===
-        if not isinstance(result, dict):
-            logger.warning("Agent returned non-dict result; coercing to dict")
-            result = {"answer": str(result)}
-
-        response_data = {
-            "type": result.get("type", "answer"),
-            "answer": result.get("answer", ""),
-            "intents": result.get("intents", []),
-            "steps": result.get("steps", []),
-            "used_tools": result.get("used_tools", []),
-            "citations": result.get("citations", []),
-            "message": result.get("message"),
-            "options": result.get("options"),
-            "secure_mode": result.get("secure_mode", req.secure_mode),
-            "masked_input": result.get("masked_input"),
-        }
-
-        response = AgentResponse(**response_data)
+        response = _to_response(result, req.secure_mode)
 
         logger.info(
             f"[AgentResponse] type={response.type} secure={response.secure_mode} "
@@ -71,3 +77,48 @@ async def invoke(req: AgentInvokeRequest, user=Depends(require_bearer)):
             status_code=500,
             detail=f"Agent processing failed: {str(e)}",
         )
+
+
+@router.post("/stream")
+async def stream(req: AgentInvokeRequest, user=Depends(require_bearer)):
+    """
+    Invoke the agent and stream the final answer as Server-Sent Events.
+
+    Emits `token` events ({"text": chunk}) while the answer is generated, then a
+    single `result` event carrying the full AgentResponse (or an `error` event).
+    In secure mode no tokens are streamed; only the masked result is sent.
+    """
+    logger.info(
+        f"[AgentStream] user={user['user_id']} "
+        f"session={req.session_id} secure_mode={req.secure_mode} "
+        f"input={req.input[:100]}"
+    )
+    loop = asyncio.get_running_loop()
+    chunks: asyncio.Queue = asyncio.Queue()
+
+    # Called from the agent's worker thread
+    def on_token(chunk: str) -> None:
+        loop.call_soon_threadsafe(chunks.put_nowait, chunk)
+
+    task = asyncio.ensure_future(agent.ahandle(
+        user_id=user["user_id"],
+        text=req.input,
+        session_id=req.session_id,
+        secure_mode=req.secure_mode,
+        on_token=on_token,
+    ))
+    # Queued after every token scheduled by the worker, so it marks the end of the stream
+    task.add_done_callback(lambda _: chunks.put_nowait(None))
+
+    async def events():
+        while (chunk := await chunks.get()) is not None:
+            yield f"event: token\ndata: {json.dumps({'text': chunk})}\n\n"
+        try:
+            response = _to_response(task.result(), req.secure_mode)
+        except Exception as e:
+            logger.error(f"[AgentStream] error: {e}", exc_info=True)
+            yield f"event: error\ndata: {json.dumps({'detail': f'Agent processing failed: {e}'})}\n\n"
+            return
+        yield f"event: result\ndata: {json.dumps(response.model_dump())}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
@@ -1,10 +1,12 @@
 ﻿from fastapi import APIRouter, Depends
 from app.security.auth import require_bearer
 from app.schemas.models import MemoryWrite
-from app.memory.sqlite_store import SQLiteStore
+from app.api.agent import agent
 
 router = APIRouter()
-store = SQLiteStore()
+# The agent's store: one writer connection and one reader pool per database file, so /memory
+# writes queue on the same lock as session writes instead of contending through busy_timeout
+store = agent.mem
 
 @router.post("/write")
 async def write(m: MemoryWrite, user=Depends(require_bearer)):
@@ -1,15 +1,44 @@
 import re
 import logging
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 
 logger = logging.getLogger(__name__)
 
+# PII detectors, compiled once and applied in this order
+_PII_PATTERNS: Dict[str, "re.Pattern[str]"] = {
+    "EMAIL": re.compile(r"[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}"),
+    "MOBILE": re.compile(r"\b(?:\+?\d{1,3}[-.\s]?)?\d{3,4}[-.\s]?\d{4}\b"),
+    "IPADDR": re.compile(r"\b(?:\d{1,3}\.){3}\d{1,3}\b|\b(?:[A-Fa-f0-9]{0,4}:){2,7}[A-Fa-f0-9]{0,4}\b"),
+}
+
+# Placeholders written by inbound(), e.g. "[EMAIL_1]"
+_MASK_TOKEN_RE = re.compile(r"\[(?:%s)_\d+\]" % "|".join(_PII_PATTERNS))
+
+# Every detector as one alternation, a named group per type in the same priority order
+_PII_ANY_RE = re.compile("|".join(f"(?P<{ptype}>{p.pattern})" for ptype, p in _PII_PATTERNS.items()))
+
+
+def _redact_pii(match: "re.Match[str]") -> str:
+    """Partially hide a PII match of _PII_ANY_RE according to its type."""
+    pii = match.group(0)
+    if match.lastgroup == "MOBILE":
+        return pii[:3] + "****" + pii[-2:]
+    if match.lastgroup == "EMAIL":
+        name, domain = pii.split("@", 1)
+        return name[0] + "***@" + domain
+    return "[REDACTED_IP]"
+
+
 class SecurityGuard:
     """
     Security and privacy guard for the Agentic AI system.
     - Detects and blocks unsafe or malicious input/output
     - Masks/unmasks PII (mobile, email, IP)
     - Sanitizes model responses for sensitive data
+
+    The guard holds no per-request state: inbound() returns the placeholder
+    map of its own call, and the caller hands it back to unmask()/outbound(),
+    so concurrent requests never see each other's PII.
     """
 
     def __init__(self):
@@ -17,71 +46,50 @@ class SecurityGuard:
             "terrorism", "bomb", "kill", "suicide", "child abuse",
             "sex", "porn", "hate speech", "racism", "violence", "drugs",
         ]
-        self.pii_patterns = {
-            "EMAIL": r"[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}",
-            "MOBILE": r"\b(?:\+?\d{1,3}[-.\s]?)?\d{3,4}[-.\s]?\d{4}\b",
-            "IPADDR": r"\b(?:\d{1,3}\.){3}\d{1,3}\b|\b(?:[A-Fa-f0-9]{0,4}:){2,7}[A-Fa-f0-9]{0,4}\b",
-        }
-        self.mask_map: Dict[str, str] = {}
+        # One alternation instead of a substring scan per keyword
+        self._blocked_re = re.compile("|".join(re.escape(k) for k in self.blocked_keywords))
+        self.pii_patterns = _PII_PATTERNS
 
     def inbound(self, text: str) -> Dict[str, Any]:
-        """Validate and mask user input."""
-        lowered = text.lower()
-        if any(bad in lowered for bad in self.blocked_keywords):
+        """Validate and mask user input; `mask_map` maps each issued placeholder to its original."""
+        if self._blocked_re.search(text.lower()):
             return {"safe": False, "text": "sorry, I cannot answer this question", "reason": "unsafe_input"}
 
         masked_text = text
-        self.mask_map.clear()
+        mask_map: Dict[str, str] = {}
         mask_index = 1
 
         for ptype, pattern in self.pii_patterns.items():
-            matches = list(re.finditer(pattern, masked_text))
-            offset = 0
-            for match in matches:
-                start, end = match.start() + offset, match.end() + offset
-                original = masked_text[start:end]
+            def mask(match: "re.Match[str]") -> str:
+                nonlocal mask_index
                 mask_token = f"[{ptype}_{mask_index}]"
-                masked_text = masked_text[:start] + mask_token + masked_text[end:]
-                offset += len(mask_token) - len(original)
-                self.mask_map[original] = mask_token
                 mask_index += 1
+                mask_map[mask_token] = match.group(0)
+                return mask_token
+
+            masked_text = pattern.sub(mask, masked_text)
+
+        return {"safe": True, "text": masked_text, "mask_map": mask_map}
 
-        return {"safe": True, "text": masked_text}
+    def unmask(self, text: str, mask_map: Dict[str, str]) -> str:
+        """Restore the originals of placeholders in mask_map (from inbound()) in one pass."""
+        if not mask_map:
+            return text
+        return _MASK_TOKEN_RE.sub(lambda m: mask_map.get(m.group(0), m.group(0)), text)
 
-    def outbound(self, text: str) -> Dict[str, Any]:
-        """Validate and sanitize model output."""
-        lowered = text.lower()
-        if any(bad in lowered for bad in self.blocked_keywords):
+    def outbound(self, text: str, mask_map: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        """Validate and sanitize model output, first restoring the placeholders of mask_map."""
+        if self._blocked_re.search(text.lower()):
             return {"safe": False, "text": "sorry, I cannot answer this question", "reason": "unsafe_output"}
 
         # Unmask inbound placeholders
-        for original, mask in self.mask_map.items():
-            text = text.replace(mask, original)
+        text = self.unmask(text, mask_map)
 
         # Detect and sanitize new PII
-        pii_found = []
-        for ptype, pattern in self.pii_patterns.items():
-            for m in re.findall(pattern, text):
-                pii_found.append(m)
-
-        if pii_found:
-            text = self._sanitize_pii_output(text, pii_found)
-
-        # Clear map to prevent leakage across queries
-        self.mask_map.clear()
+        text = self._sanitize_pii_output(text)
 
         return {"safe": True, "text": text}
 
-    def _sanitize_pii_output(self, text: str, pii_list: list[str]) -> str:
-        """Sanitize PII in model-generated output."""
-        for pii in pii_list:
-            if re.match(self.pii_patterns["MOBILE"], pii):
-                text = text.replace(pii, pii[:3] + "****" + pii[-2:])
-            elif re.match(self.pii_patterns["EMAIL"], pii):
-                name, domain = pii.split("@", 1)
-                text = text.replace(pii, name[0] + "***@" + domain)
-            elif re.match(self.pii_patterns["IPADDR"], pii):
-                text = text.replace(pii, "[REDACTED_IP]")
-            else:
-                text = text.replace(pii, "[REDACTED]")
-        return text
+    def _sanitize_pii_output(self, text: str) -> str:
+        """Sanitize PII in model-generated output (one scan, each match redacted by its type)."""
+        return _PII_ANY_RE.sub(_redact_pii, text)
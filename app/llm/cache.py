@@ -0,0 +1,115 @@
+"""Semantic cache for LLM results keyed by query embedding + prompt hash."""
+from collections import OrderedDict
+from typing import Any, Callable, List, Optional, Tuple
+import hashlib
+import logging
+import threading
+import time
+
+import numpy as np
+
+from app.memory import similarity
+
+logger = logging.getLogger(__name__)
+
+
+def prompt_hash(*parts: str) -> int:
+    """Stable 64-bit hash of the prompt parts that must match exactly."""
+    digest = hashlib.blake2b("\x1f".join(parts).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+class SemanticLLMCache:
+    """
+    Bounded in-memory cache of LLM results.
+
+    Entries are (embedding, prompt_hash, response) tuples. Embeddings live in a
+    single contiguous (capacity, d) float32 matrix of L2-normalized rows; a
+    lookup only scores rows with an identical prompt hash (e.g. same context)
+    in one fused pass. A hit requires cosine similarity >= threshold on the text.
+    Entries stored with a ttl stop matching once it has elapsed.
+
+    Args:
+        embed_fn: Callable mapping a list of texts to a list of vectors
+        capacity: Maximum number of cached entries (LRU eviction)
+        threshold: Minimum cosine similarity for a hit
+        ttl: Default time-to-live in seconds for stored entries (None = no expiry)
+    """
+
+    def __init__(
+        self,
+        embed_fn: Callable[[List[str]], List[List[float]]],
+        capacity: int = 256,
+        threshold: float = 0.95,
+        ttl: Optional[float] = None,
+    ):
+        self.embed_fn = embed_fn
+        self.capacity = capacity
+        self.threshold = threshold
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+        self._matrix: Optional[np.ndarray] = None
+        self._hashes = np.zeros(capacity, dtype=np.uint64)
+        self._expires = np.full(capacity, np.inf)  # monotonic deadline per slot
+        self._entries: "OrderedDict[int, Any]" = OrderedDict()  # slot -> response
+        self._lock = threading.Lock()
+        self._last: Optional[Tuple[str, np.ndarray]] = None  # (text, vector), swapped atomically
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def embed(self, text: str) -> np.ndarray:
+        """Return the L2-normalized embedding of text (memoized for the last text)."""
+        last = self._last
+        if last is not None and last[0] == text:
+            return last[1]
+        vec = np.asarray(self.embed_fn([text])[0], dtype=np.float32)
+        norm = float(np.linalg.norm(vec))
+        if norm > 0:
+            vec = vec / norm
+        self._last = (text, vec)
+        return vec
+
+    def lookup(self, text: str, key: int) -> Optional[Any]:
+        """Return the cached response for a semantically-near text, or None."""
+        q = self.embed(text)
+        with self._lock:
+            n = len(self._entries)
+            if n == 0 or self._matrix is None or self._matrix.shape[1] != q.shape[0]:
+                self.misses += 1
+                return None
+            slot, score = similarity.best_keyed_match(
+                self._matrix[:n], q, self._hashes[:n], np.uint64(key), self._expires[:n], time.monotonic()
+            )
+            if slot < 0 or score < self.threshold:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(slot)
+            self.hits += 1
+            logger.debug(f"Semantic cache hit (similarity={score:.3f})")
+            return self._entries[slot]
+
+    def store(self, text: str, key: int, response: Any, ttl: Optional[float] = None) -> None:
+        """Insert a response, evicting the least recently used entry when full."""
+        ttl = self.ttl if ttl is None else ttl
+        q = self.embed(text)
+        with self._lock:
+            if self._matrix is None or self._matrix.shape[1] != q.shape[0]:
+                self._matrix = np.zeros((self.capacity, q.shape[0]), dtype=np.float32)
+                self._entries.clear()
+            if len(self._entries) < self.capacity:
+                slot = len(self._entries)
+            else:
+                slot, _ = self._entries.popitem(last=False)
+            self._matrix[slot] = q
+            self._hashes[slot] = np.uint64(key)
+            self._expires[slot] = time.monotonic() + ttl if ttl else np.inf
+            self._entries[slot] = response
+
+    def clear(self) -> None:
+        """Drop every cached entry."""
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
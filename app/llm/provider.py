@@ -1,7 +1,11 @@
 ﻿"""LLM abstraction with real LLM provider support."""
-from typing import List, Dict
+from concurrent.futures import Future
+from typing import Any, Dict, Iterator, List, Optional
 import logging
+import threading
+from app.llm.cache import prompt_hash
 from app.utils.config import settings
+from app.utils import serialization as json
 
 logger = logging.getLogger(__name__)
 
@@ -9,9 +13,14 @@ logger = logging.getLogger(__name__)
 class LLMProvider:
     """Unified LLM provider supporting multiple backends."""
     
-    def __init__(self):
+    def __init__(self, http_client=None):
         self.provider = settings.LLM_PROVIDER.lower()
         self._client = None
+        self._http_client = http_client  # optional shared httpx.Client for OpenAI-compatible SDKs
+        # Identical chat requests in flight at the same time share one backend call
+        self._inflight: Dict[int, Future] = {}
+        self._inflight_lock = threading.Lock()
+        self.coalesced = 0
         self._init_provider()
     
     def _init_provider(self):
@@ -36,7 +45,9 @@ class LLMProvider:
                 raise ValueError("DEEPSEEK_API_KEY not configured")
             self._client = OpenAI(
                 api_key=settings.DEEPSEEK_API_KEY,
-                base_url=settings.DEEPSEEK_BASE_URL
+                base_url=settings.DEEPSEEK_BASE_URL,
+                http_client=self._http_client,
+                max_retries=settings.LLM_MAX_RETRIES,
             )
             logger.info(f"DeepSeek initialized with model: {settings.DEEPSEEK_MODEL}")
         except Exception as e:
@@ -64,48 +75,200 @@ class LLMProvider:
                 raise ValueError("OPENAI_API_KEY not configured")
             self._client = OpenAI(
                 api_key=settings.OPENAI_API_KEY,
-                base_url=settings.OPENAI_BASE_URL
+                base_url=settings.OPENAI_BASE_URL,
+                http_client=self._http_client,
+                max_retries=settings.LLM_MAX_RETRIES,
             )
             logger.info(f"OpenAI initialized with model: {settings.OPENAI_MODEL}")
         except Exception as e:
             logger.error(f"Failed to initialize OpenAI: {e}")
             self.provider = "mock"
     
-    def chat(self, messages: List[Dict]) -> str:
+    def chat(self, messages: List[Dict], prompt_cache_key: Optional[str] = None) -> str:
         """
         Send chat messages to LLM and get response.
         
         Args:
             messages: List of message dicts with 'role' and 'content'
+            prompt_cache_key: Name of the static prompt prefix (OpenAI only); requests
+                sharing it are routed to the same prefix cache
         
         Returns:
             Response string from LLM
         """
+        key = prompt_hash(self.provider, json.dumps(messages))
+        with self._inflight_lock:
+            pending = self._inflight.get(key)
+            if pending is None:
+                pending = self._inflight[key] = Future()
+                leader = True
+            else:
+                self.coalesced += 1
+                leader = False
+        if not leader:
+            return pending.result()
+
+        try:
+            response = self._dispatch(messages, prompt_cache_key)
+            pending.set_result(response)
+            return response
+        except BaseException as e:
+            pending.set_exception(e)
+            raise
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(key, None)
+
+    def _dispatch(self, messages: List[Dict], prompt_cache_key: Optional[str] = None) -> str:
+        """Route a chat request to the configured backend (errors become an 'Error: ...' reply)."""
         try:
             if self.provider == "deepseek" or self.provider == "openai":
-                return self._chat_openai_compatible(messages)
+                return self._chat_openai_compatible(messages, prompt_cache_key)
             elif self.provider == "gemini":
                 return self._chat_gemini(messages)
             else:
                 return self._chat_mock(messages)
         except Exception as e:
-            logger.error(f"Chat failed: {e}")
+            logger.error("Chat failed: %r", e)  # no traceback: provider errors come in bursts
             return f"Error: {str(e)}"
     
-    def _chat_openai_compatible(self, messages: List[Dict]) -> str:
+    def chat_stream(
+        self, messages: List[Dict], prompt_cache_key: Optional[str] = None, schema: Optional[Dict[str, Any]] = None
+    ) -> Iterator[str]:
+        """
+        Yield the reply in chunks as the backend generates it.
+
+        Unlike `chat`, requests are not coalesced and backend errors propagate
+        to the caller (possibly after some chunks were already yielded).
+        Closing the iterator early closes the HTTP stream, ending generation.
+        `schema` (a JSON schema) constrains the reply to JSON: enforced as
+        json_schema on OpenAI, as JSON mode on DeepSeek and Gemini.
+        """
+        if self.provider == "deepseek" or self.provider == "openai":
+            model = settings.DEEPSEEK_MODEL if self.provider == "deepseek" else settings.OPENAI_MODEL
+            stream = self._client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=0.7,
+                max_tokens=1000,
+                stream=True,
+                **self._openai_extras(prompt_cache_key, schema)
+            )
+            try:
+                for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+            finally:
+                stream.close()
+        elif self.provider == "gemini":
+            extra = {"generation_config": {"response_mime_type": "application/json"}} if schema else {}
+            for chunk in self._client.generate_content(self._gemini_prompt(messages), stream=True, **extra):
+                if chunk.text:
+                    yield chunk.text
+        else:
+            # Mock: replay the canned reply word by word
+            reply = self._chat_mock(messages)
+            start = 0
+            while start < len(reply):
+                end = reply.find(" ", start) + 1 or len(reply)
+                yield reply[start:end]
+                start = end
+
+    def chat_json(
+        self, messages: List[Dict], prompt_cache_key: Optional[str] = None, schema: Optional[Dict[str, Any]] = None
+    ) -> str:
+        """
+        Stream a reply expected to be one JSON object and stop once the object is complete.
+
+        A reply that opens with "{" (bare or inside a ```json fence) is cut at
+        the brace closing it and returned as just the object, so the backend
+        stops generating whatever the model appends after it. Any other reply
+        is read and returned in full. Backend errors propagate, and `schema` is
+        applied, as in `chat_stream`.
+        """
+        text = ""
+        start = None  # index of the object's opening brace; -1 once the reply is known not to open with one
+        depth, in_string, escaped, scanned = 0, False, False, 0
+        stream = self.chat_stream(messages, prompt_cache_key, schema)
+        try:
+            for chunk in stream:
+                text += chunk
+                if start is None:
+                    lead = text.lstrip()
+                    if lead.startswith("{"):
+                        start = len(text) - len(lead)
+                    elif lead.startswith("```json"):
+                        if "{" not in lead:
+                            continue
+                        start = text.index("{")
+                    elif not lead or "```json".startswith(lead):
+                        continue  # too short to tell yet
+                    else:
+                        start = -1
+                    scanned = start
+                if start < 0:
+                    continue
+                for i in range(scanned, len(text)):
+                    c = text[i]
+                    if in_string:
+                        if escaped:
+                            escaped = False
+                        elif c == "\\":
+                            escaped = True
+                        elif c == '"':
+                            in_string = False
+                    elif c == '"':
+                        in_string = True
+                    elif c == "{":
+                        depth += 1
+                    elif c == "}":
+                        depth -= 1
+                        if depth == 0:
+                            return text[start:i + 1]
+                scanned = len(text)
+        finally:
+            stream.close()
+        return text
+
+    def _chat_openai_compatible(self, messages: List[Dict], prompt_cache_key: Optional[str] = None) -> str:
         """Chat using OpenAI-compatible API (OpenAI, DeepSeek)."""
         model = settings.DEEPSEEK_MODEL if self.provider == "deepseek" else settings.OPENAI_MODEL
         response = self._client.chat.completions.create(
             model=model,
             messages=messages,
             temperature=0.7,
-            max_tokens=1000
+            max_tokens=1000,
+            **self._openai_extras(prompt_cache_key)
         )
         return response.choices[0].message.content
+
+    def _openai_extras(
+        self, prompt_cache_key: Optional[str] = None, schema: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """Optional create() arguments for OpenAI-compatible backends."""
+        extra: Dict[str, Any] = {}
+        if self.provider == "openai":
+            if prompt_cache_key:
+                # Sent as extra_body so older SDKs without the keyword still accept it;
+                # DeepSeek caches prefixes automatically and takes no hint
+                extra["extra_body"] = {"prompt_cache_key": prompt_cache_key}
+            if schema:
+                extra["response_format"] = {
+                    "type": "json_schema",
+                    "json_schema": {"name": schema.get("title", "response"), "schema": schema},
+                }
+        elif schema:
+            extra["response_format"] = {"type": "json_object"}  # DeepSeek: JSON mode only
+        return extra
     
     def _chat_gemini(self, messages: List[Dict]) -> str:
         """Chat using Google Gemini API."""
-        # Convert messages to Gemini format
+        response = self._client.generate_content(self._gemini_prompt(messages))
+        return response.text
+
+    @staticmethod
+    def _gemini_prompt(messages: List[Dict]) -> str:
+        """Convert chat messages to a single Gemini prompt."""
         # Gemini uses a simpler format, combine system + user messages
         prompt_parts = []
         for msg in messages:
@@ -118,9 +281,7 @@ class LLMProvider:
             elif role == "assistant":
                 prompt_parts.append(f"Assistant: {content}")
         
-        prompt = "\n\n".join(prompt_parts)
-        response = self._client.generate_content(prompt)
-        return response.text
+        return "\n\n".join(prompt_parts)
     
     def _chat_mock(self, messages: List[Dict]) -> str:
         """Mock implementation for testing."""
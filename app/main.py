@@ -1,7 +1,9 @@
 ﻿# app/main.py
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.api.agent import router as agent_router
+from app.api.agent import router as agent_router, agent
 from app.api.tools import router as tools_router
 from app.api.memory import router as memory_router
 from app.api.auth import router as auth_router  # 新增
@@ -10,9 +12,23 @@ from app.api.admin import router as admin_router
 from app.utils.config import settings
 from app.utils.logging import configure_logging
 
+try:
+    import orjson  # noqa: F401  (required by ORJSONResponse)
+    from fastapi.responses import ORJSONResponse as DefaultResponse
+except ImportError:
+    from fastapi.responses import JSONResponse as DefaultResponse
+
 configure_logging()
 
-app = FastAPI(title="Agentic AI MVP", version="0.2.0")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    agent.close()  # finish queued memory writes, stop worker pools
+
+
+# Response bodies are rendered with orjson when available (same compact JSON as the stdlib encoder)
+app = FastAPI(title="Agentic AI MVP", version="0.2.0", lifespan=lifespan, default_response_class=DefaultResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -0,0 +1,251 @@
+# =====================================================
+# app/memory/similarity.py
+# Contiguous embedding matrix + vectorized cosine top-k
+# =====================================================
+
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    from numba import njit, prange
+    _HAVE_NUMBA = True
+except Exception:
+    _HAVE_NUMBA = False
+
+# Below this many rows the fused Numba kernel beats matmul + argpartition (allocation-bound);
+# above it BLAS throughput wins
+NUMBA_MAX_ROWS = 10_000
+
+
+def _normalize_rows(vecs: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vecs, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vecs / norms
+
+
+def quantize_rows(rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Symmetric per-row int8 quantization: rows ~= q * scale[:, None]."""
+    scales = np.abs(rows).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    q = np.rint(rows / scales[:, None]).astype(np.int8)
+    return q, scales.astype(np.float32)
+
+
+if _HAVE_NUMBA:
+    @njit(cache=True)
+    def _select_topk(scores, k):
+        """Indices/scores of the k largest finite scores by repeated max (k is small)."""
+        n = scores.shape[0]
+        k = min(k, n)
+        idx = np.empty(k, dtype=np.int64)
+        out = np.empty(k, dtype=np.float32)
+        found = 0
+        for r in range(k):
+            best = -1
+            best_score = -np.inf
+            for i in range(n):
+                if scores[i] > best_score:
+                    best_score = scores[i]
+                    best = i
+            if best < 0:
+                break
+            idx[r] = best
+            out[r] = best_score
+            scores[best] = -np.inf
+            found += 1
+        return idx[:found], out[:found]
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _topk_cosine(M, q, k, mask):
+        """Dot every row with q (masked rows -> -inf), then select the k best."""
+        n, d = M.shape
+        scores = np.empty(n, dtype=np.float32)
+        for i in prange(n):
+            if mask[i]:
+                acc = np.float32(0.0)
+                for j in range(d):
+                    acc += M[i, j] * q[j]
+                scores[i] = acc
+            else:
+                scores[i] = -np.inf
+        return _select_topk(scores, k)
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _topk_cosine_int8(Q, scales, q, k, mask):
+        """Like _topk_cosine over int8 rows; each row's dot is rescaled by its scale."""
+        n, d = Q.shape
+        scores = np.empty(n, dtype=np.float32)
+        for i in prange(n):
+            if mask[i]:
+                acc = np.float32(0.0)
+                for j in range(d):
+                    acc += np.float32(Q[i, j]) * q[j]
+                scores[i] = acc * scales[i]
+            else:
+                scores[i] = -np.inf
+        return _select_topk(scores, k)
+
+
+    @njit(fastmath=True, cache=True)
+    def _best_keyed_match(M, q, hashes, key, expires, now):
+        """Fused filter + dot + argmax: only rows with hashes == key and expires > now are scored."""
+        n, d = M.shape
+        best = -1
+        best_score = -np.inf
+        for i in range(n):
+            if hashes[i] != key or expires[i] <= now:
+                continue
+            acc = np.float32(0.0)
+            for j in range(d):
+                acc += M[i, j] * q[j]
+            if acc > best_score:
+                best_score = acc
+                best = i
+        return best, best_score
+
+
+def best_keyed_match(
+    M: np.ndarray, q: np.ndarray, hashes: np.ndarray, key: np.uint64, expires: np.ndarray, now: float
+) -> Tuple[int, float]:
+    """
+    Row of M most similar to q among rows whose hash equals key and that expire after now.
+
+    Rows failing the key/expiry test are never dotted, so the cost scales with
+    the number of candidate rows rather than with len(M). Returns (-1, -inf)
+    when no row qualifies.
+    """
+    if _HAVE_NUMBA:
+        best, score = _best_keyed_match(M, q, hashes, key, expires, now)
+        return int(best), float(score)
+    candidates = np.flatnonzero((hashes == key) & (expires > now))
+    if candidates.size == 0:
+        return -1, float("-inf")
+    sims = M[candidates] @ q
+    i = int(np.argmax(sims))
+    return int(candidates[i]), float(sims[i])
+
+
+def warmup() -> None:
+    """Trigger (or load the cached) JIT compilation so the first real search is not slow."""
+    if _HAVE_NUMBA:
+        M = np.ones((16, 8), dtype=np.float32)
+        mask = np.ones(16, dtype=np.bool_)
+        _topk_cosine(M, M[0], 3, mask)
+        Q, scales = quantize_rows(M)
+        _topk_cosine_int8(Q, scales, M[0], 3, mask)
+        _best_keyed_match(M, M[0], np.zeros(16, dtype=np.uint64), np.uint64(0), np.full(16, np.inf), 0.0)
+
+
+class EmbeddingMatrix:
+    """
+    Row-major (N, d) matrix of L2-normalized embeddings.
+
+    Rows are appended into a buffer that doubles when full, so ingestion is
+    amortized O(1) per row, and cosine similarity against all rows is a single
+    matrix-vector product. Row i always corresponds to the i-th stored document.
+
+    With `quantize=True` rows are stored as int8 with a float32 scale per row
+    (4x less memory and bandwidth per search, cosine error ~1e-3).
+
+    Args:
+        initial_capacity: Number of rows allocated on first append
+        quantize: Store rows as per-row-scaled int8 instead of float32
+    """
+
+    def __init__(self, initial_capacity: int = 64, quantize: bool = False):
+        self.initial_capacity = initial_capacity
+        self.quantize = quantize
+        self._buf: Optional[np.ndarray] = None
+        self._scales: Optional[np.ndarray] = None  # per-row scales when quantized
+        self._n = 0
+
+    def __len__(self) -> int:
+        return self._n
+
+    @property
+    def rows(self) -> np.ndarray:
+        """Filled rows as float32 (dequantized copy when quantized; (0, 0) before the first append)."""
+        if self._buf is None:
+            return np.zeros((0, 0), dtype=np.float32)
+        if self.quantize:
+            return self._buf[:self._n].astype(np.float32) * self._scales[:self._n, None]
+        return self._buf[:self._n]
+
+    def append(self, vecs: Sequence[Sequence[float]]) -> None:
+        """Normalize and append a batch of vectors."""
+        if len(vecs) == 0:
+            return
+        block = _normalize_rows(np.asarray(vecs, dtype=np.float32).reshape(len(vecs), -1))
+        scales = None
+        if self.quantize:
+            block, scales = quantize_rows(block)
+        need = self._n + block.shape[0]
+        if self._buf is None or need > self._buf.shape[0]:
+            capacity = max(self.initial_capacity, need) if self._buf is None else max(self._buf.shape[0] * 2, need)
+            grown = np.empty((capacity, block.shape[1]), dtype=block.dtype)
+            grown_scales = np.empty(capacity, dtype=np.float32)
+            if self._buf is not None:
+                grown[:self._n] = self._buf[:self._n]
+                grown_scales[:self._n] = self._scales[:self._n]
+            self._buf, self._scales = grown, grown_scales
+        self._buf[self._n:need] = block
+        if scales is not None:
+            self._scales[self._n:need] = scales
+        self._n = need
+
+    def keep(self, mask: Sequence[bool]) -> None:
+        """Drop every row whose mask entry is False (order of kept rows is preserved)."""
+        if self._buf is None:
+            return
+        mask = np.asarray(mask, dtype=bool)
+        kept = self._buf[:self._n][mask]
+        kept_scales = self._scales[:self._n][mask]
+        self._n = kept.shape[0]
+        self._buf[:self._n] = kept
+        self._scales[:self._n] = kept_scales
+
+    def clear(self) -> None:
+        self._buf = None
+        self._scales = None
+        self._n = 0
+
+    def topk(self, query: Sequence[float], k: int, mask: Optional[np.ndarray] = None) -> Tuple[List[int], List[float]]:
+        """
+        Return (row indices, cosine scores) of the k most similar rows, best first.
+
+        Args:
+            query: Query vector (need not be normalized)
+            k: Number of results
+            mask: Optional boolean array; rows where it is False are excluded
+        """
+        if self._n == 0 or k <= 0:
+            return [], []
+        q = np.asarray(query, dtype=np.float32)
+        norm = float(np.linalg.norm(q))
+        if norm > 0:
+            q = q / norm
+        q = q.astype(np.float32, copy=False)
+        matrix = self._buf[:self._n]
+
+        if _HAVE_NUMBA and self._n <= NUMBA_MAX_ROWS and k <= 32:
+            keep = np.ones(self._n, dtype=np.bool_) if mask is None else np.asarray(mask, dtype=np.bool_)
+            if self.quantize:
+                idx, scores = _topk_cosine_int8(matrix, self._scales[:self._n], q, k, keep)
+            else:
+                idx, scores = _topk_cosine(matrix, q, k, keep)
+            return idx.tolist(), scores.tolist()
+
+        if self.quantize:
+            scores = (matrix @ q) * self._scales[:self._n]
+        else:
+            scores = matrix @ q
+        candidates = np.arange(self._n) if mask is None else np.flatnonzero(mask)
+        if candidates.size == 0:
+            return [], []
+        cand_scores = scores[candidates]
+        if candidates.size > k:
+            part = np.argpartition(-cand_scores, k - 1)[:k]
+            candidates, cand_scores = candidates[part], cand_scores[part]
+        order = np.argsort(-cand_scores, kind="stable")
+        return candidates[order].tolist(), cand_scores[order].tolist()
@@ -1,41 +1,162 @@
-﻿import sqlite3
+﻿import os
+import queue
+import sqlite3
+import threading
 import time
-from typing import Any, List, Dict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Iterable, Iterator, List, Dict, Optional, Tuple
 from app.utils.config import SESSION_MEM_PATH
 
+# (user_id, namespace, type, content, ttl) — content=None deletes the key
+MemoryRow = Tuple[str, str, str, Optional[str], Optional[int]]
+
+
 class SQLiteStore:
-    def __init__(self, path: str | None = None):
+    """
+    SQLite-backed session memory.
+
+    One long-lived writer connection (WAL journal) is serialized with a lock,
+    while reads check out one of a bounded pool of read-only connections, so a
+    session read never waits behind another request's write. Readers are
+    opened on demand, so a short-lived store only pays for the ones it uses. WAL adds
+    `-wal`/`-shm` sidecar files next to the db, so copy or delete all three
+    together. Multi-statement writes go through `transaction()` (BEGIN
+    IMMEDIATE); single statements autocommit.
+    """
+
+    PRAGMAS = (
+        "PRAGMA journal_mode=WAL",
+        "PRAGMA synchronous=NORMAL",
+        "PRAGMA busy_timeout=5000",
+        "PRAGMA temp_store=MEMORY",
+        "PRAGMA cache_size=-20000",
+        "PRAGMA foreign_keys=ON",
+    )
+    READ_PRAGMAS = (
+        "PRAGMA busy_timeout=5000",
+        "PRAGMA temp_store=MEMORY",
+        "PRAGMA cache_size=-20000",
+        "PRAGMA query_only=ON",
+    )
+
+    def __init__(self, path: str | None = None, readers: int | None = None):
         # Default path from config
         self.path = path or SESSION_MEM_PATH
         
         # Ensure directory exists
-        from pathlib import Path
         Path(self.path).parent.mkdir(parents=True, exist_ok=True)
         
+        self._lock = threading.RLock()
+        self._conn = self._connect()
         self._init()
 
+        # Idle read-only connections; at most pool_size are ever opened
+        self._pool_size = readers or min(os.cpu_count() or 1, 8)
+        self._readers: "queue.Queue[sqlite3.Connection]" = queue.Queue(maxsize=self._pool_size)
+        self._opened_readers = 0
+        self._readers_lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        for pragma in self.PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def _connect_reader(self) -> sqlite3.Connection:
+        uri = f"{Path(self.path).resolve().as_uri()}?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False, isolation_level=None)
+        for pragma in self.READ_PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    @contextmanager
+    def _reader(self) -> Iterator[sqlite3.Connection]:
+        """Check out a pooled read-only connection (opened on demand; blocks while all are in use)."""
+        try:
+            conn = self._readers.get_nowait()
+        except queue.Empty:
+            with self._readers_lock:
+                can_open = self._opened_readers < self._pool_size
+                if can_open:
+                    self._opened_readers += 1
+            conn = self._connect_reader() if can_open else self._readers.get()
+        try:
+            yield conn
+        finally:
+            self._readers.put(conn)
+
     def _init(self):
-        with sqlite3.connect(self.path) as conn:
-            conn.execute(
+        with self._lock:
+            self._conn.execute(
                 "CREATE TABLE IF NOT EXISTS memories (id INTEGER PRIMARY KEY, user_id TEXT, namespace TEXT, type TEXT, content TEXT, ttl INTEGER, created_at INTEGER)"
             )
-            conn.execute(
+            # Session reads filter on (user_id, namespace); keyed replaces also match type
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_memories_key ON memories(user_id, namespace, type)"
+            )
+            self._conn.execute(
                 "CREATE TABLE IF NOT EXISTS kb_chunks (id INTEGER PRIMARY KEY, doc_id TEXT, chunk_text TEXT, metadata TEXT)"
             )
 
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Run several statements in one BEGIN IMMEDIATE ... COMMIT block."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def close(self):
+        """Close the writer and every pooled reader."""
+        with self._lock:
+            self._conn.close()
+        while True:
+            try:
+                self._readers.get_nowait().close()
+            except queue.Empty:
+                break
+
     def write(self, user_id: str, namespace: str, mtype: str, content: str, ttl: int | None):
         now = int(time.time())
-        with sqlite3.connect(self.path) as conn:
-            conn.execute(
+        with self._lock:
+            self._conn.execute(
                 "INSERT INTO memories(user_id, namespace, type, content, ttl, created_at) VALUES(?,?,?,?,?,?)",
                 (user_id, namespace, mtype, content, ttl or 0, now),
             )
 
+    def write_many(self, rows: Iterable[MemoryRow]):
+        """
+        Set several keys in a single transaction (one commit).
+
+        Unlike `write`, which appends to a key's history, each row replaces every
+        record stored under its key, so a key holds at most one row.
+        """
+        now = int(time.time())
+        rows = list(rows)
+        with self.transaction() as conn:
+            conn.executemany(
+                "DELETE FROM memories WHERE user_id=? AND namespace=? AND type=?",
+                [(user_id, namespace, mtype) for user_id, namespace, mtype, _, _ in rows],
+            )
+            conn.executemany(
+                "INSERT INTO memories(user_id, namespace, type, content, ttl, created_at) VALUES(?,?,?,?,?,?)",
+                [
+                    (user_id, namespace, mtype, content, ttl or 0, now)
+                    for user_id, namespace, mtype, content, ttl in rows
+                    if content is not None
+                ],
+            )
+
     def read(self, user_id: str, namespace: str, limit: int = 10) -> list[dict]:
         now = int(time.time())
-        with sqlite3.connect(self.path) as conn:
+        with self._reader() as conn:
             rows = conn.execute(
-                "SELECT content, type, ttl, created_at FROM memories WHERE user_id=? AND namespace=? ORDER BY created_at DESC LIMIT ?",
+                "SELECT content, type, ttl, created_at FROM memories WHERE user_id=? AND namespace=? ORDER BY created_at DESC, id DESC LIMIT ?",
                 (user_id, namespace, limit),
             ).fetchall()
         def alive(r):
@@ -49,30 +170,36 @@ class SQLiteStore:
 
     def delete(self, user_id: str, namespace: str, mtype: str):
         """Delete stored memories matching the given key."""
-        with sqlite3.connect(self.path) as conn:
-            conn.execute(
+        with self._lock:
+            self._conn.execute(
                 "DELETE FROM memories WHERE user_id=? AND namespace=? AND type=?",
                 (user_id, namespace, mtype),
             )
-            conn.commit()
+
+    def clear_namespace(self, user_id: str, namespace: str):
+        """Remove every record stored under a user's namespace."""
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM memories WHERE user_id=? AND namespace=?",
+                (user_id, namespace),
+            )
 
     def clear_all(self):
         """Remove every record from all tables."""
-        with sqlite3.connect(self.path) as conn:
+        with self.transaction() as conn:
             conn.execute("DELETE FROM memories")
             conn.execute("DELETE FROM kb_chunks")
-            conn.commit()
 
     def list_session_contexts(self, user_id: str) -> List[Dict[str, Any]]:
         """Return the latest stored context per session for a user."""
         now = int(time.time())
-        with sqlite3.connect(self.path) as conn:
+        with self._reader() as conn:
             rows = conn.execute(
                 """
                 SELECT namespace, content, ttl, created_at
                 FROM memories
                 WHERE user_id=? AND type='context'
-                ORDER BY created_at DESC
+                ORDER BY created_at DESC, id DESC
                 """,
                 (user_id,),
             ).fetchall()
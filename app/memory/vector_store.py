@@ -3,8 +3,14 @@
 # VectorStore backend + KnowledgeBaseStore + LongTermMemoryStore
 # =====================================================
 
-from typing import List, Dict
-from math import sqrt
+import random
+import threading
+from functools import lru_cache
+from typing import Any, List, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.memory.similarity import EmbeddingMatrix
 
 try:
     import chromadb
@@ -14,6 +20,12 @@ except Exception:
     _HAVE_CHROMA = False
 
 
+def _pseudo_embed(text: str) -> List[float]:
+    """Deterministic hash-seeded embedding used when Chroma is unavailable."""
+    rng = random.Random(hash(text) & 0xffffffff)  # local RNG: never reseed the global one
+    return [rng.random() for _ in range(64)]
+
+
 # =====================================================
 # 🔹 Base VectorStore (Core Implementation)
 # =====================================================
@@ -29,15 +41,31 @@ class VectorStore:
         path: Base path for persistent storage
         collection: Logical collection name
         use_cosine: Whether to use cosine similarity (default: True)
+        query_cache_size: Number of query embeddings kept in the LRU cache
+        quantize: Keep fallback embeddings as int8 rows (ignored by the Chroma backend)
+        hnsw_params: Chroma HNSW index settings, e.g. {"M": 32, "search_ef": 64};
+            applied when the collection is created (ignored by the fallback,
+            which does an exact vectorized scan)
     """
 
-    def __init__(self, path: str, collection: str, use_cosine: bool = True):
+    def __init__(
+        self,
+        path: str,
+        collection: str,
+        use_cosine: bool = True,
+        query_cache_size: int = 1024,
+        quantize: bool = False,
+        hnsw_params: Optional[Dict[str, Any]] = None,
+    ):
         self.collection_name = collection
+        # Per-instance LRU of whitespace-normalized query text -> float32 vector
+        self._embed_query = lru_cache(maxsize=query_cache_size)(self._embed_query_uncached)
 
         if _HAVE_CHROMA:
             self.client = chromadb.PersistentClient(path=path)
             self.embedder = embedding_functions.DefaultEmbeddingFunction()
             metadata = {"hnsw:space": "cosine" if use_cosine else "l2"}
+            metadata.update({f"hnsw:{k}": v for k, v in (hnsw_params or {}).items()})
             self.coll = self.client.get_or_create_collection(
                 name=collection,
                 embedding_function=self.embedder,
@@ -46,6 +74,11 @@ class VectorStore:
         else:
             self.docs: list[str] = []
             self.meta: list[dict] = []
+            self._vectors = EmbeddingMatrix(quantize=quantize)  # row i embeds self.docs[i]
+            # (metadata key, value) -> row indices, so `where` filters skip a Python scan
+            self._postings: Dict[Tuple[str, Any], List[int]] = {}
+            # Keeps docs/meta/_vectors/_postings row-aligned across concurrent callers
+            self._lock = threading.RLock()
 
     # =====================================================
     # Ingestion
@@ -68,32 +101,97 @@ class VectorStore:
                 metadatas=[d.get("metadata", {}) for d in docs]
             )
         else:
-            for d in docs:
-                self.docs.append(d["text"])
-                self.meta.append(d.get("metadata", {}))
+            texts = [d["text"] for d in docs]
+            vectors = self.embed(texts)
+            with self._lock:
+                start = len(self.docs)
+                self.docs.extend(texts)
+                self.meta.extend(d.get("metadata", {}) for d in docs)
+                self._index_meta(start)
+                self._vectors.append(vectors)
+
+    def _index_meta(self, start: int = 0) -> None:
+        """Add self.meta[start:] to the metadata postings (fallback backend)."""
+        for row in range(start, len(self.meta)):
+            meta = self.meta[row]
+            if not isinstance(meta, dict):
+                continue
+            for key, value in meta.items():
+                try:
+                    self._postings.setdefault((key, value), []).append(row)
+                except TypeError:  # unhashable values are matched by scanning
+                    pass
+
+    def _filter_mask(self, where: Dict) -> np.ndarray:
+        """Boolean row mask for an equality filter, optionally wrapped in {"$and": [...]}."""
+        n = len(self.meta)
+        clauses = [(k, v) for k, v in where.items() if k != "$and"]
+        clauses += [(k, v) for clause in where.get("$and", []) for k, v in clause.items()]
+        mask = np.ones(n, dtype=bool)
+        for key, value in clauses:
+            hit = np.zeros(n, dtype=bool)
+            try:
+                hit[self._postings.get((key, value), [])] = True
+            except TypeError:
+                hit = np.fromiter(
+                    (isinstance(m, dict) and m.get(key) == value for m in self.meta), dtype=bool, count=n
+                )
+            mask &= hit
+        return mask
+
+    # =====================================================
+    # Embedding
+    # =====================================================
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed texts with the same model used for ingestion and querying.
+
+        Returns one vector per input text.
+        """
+        if _HAVE_CHROMA:
+            return [list(v) for v in self.embedder(texts)]
+        return [_pseudo_embed(t) for t in texts]
+
+    def _embed_query_uncached(self, text: str) -> np.ndarray:
+        vec = np.asarray(self.embed([text])[0], dtype=np.float32)
+        vec.flags.writeable = False  # shared by every cache hit
+        return vec
+
+    def embed_query(self, query: str) -> np.ndarray:
+        """Embed a query, reusing the vector for repeated (whitespace-normalized) text."""
+        return self._embed_query(" ".join(query.split()))
+
+    def query_cache_info(self):
+        """Hit/miss statistics of the query embedding cache."""
+        return self._embed_query.cache_info()
 
     # =====================================================
     # Querying
     # =====================================================
-    def query(self, query: str, top_k: int = 3, where: Dict | None = None) -> List[Dict]:
+    def query(
+        self, query: str, top_k: int = 3, where: Dict | None = None, query_embedding: Sequence[float] | None = None
+    ) -> List[Dict]:
         """
         Perform semantic search against the stored vectors.
 
         Args:
             query: Text query
             top_k: Number of results to return (default: 3)
+            where: Optional metadata filter
+            query_embedding: Precomputed embedding of query (skips embed_query)
 
         Returns:
-            A list of dicts containing:
+            A list of dicts, best match first, containing:
                 - "chunk": Retrieved text
                 - "score": Similarity score (0–1)
                 - "doc_id": Document ID
                 - "metadata": Associated metadata
         """
         out = []
+        q_vec = self.embed_query(query) if query_embedding is None else query_embedding
         if _HAVE_CHROMA:
             chroma_kwargs = {
-                "query_texts": [query],
+                "query_embeddings": [np.asarray(q_vec, dtype=np.float32).tolist()],
                 "n_results": top_k,
             }
             if where:
@@ -108,45 +206,19 @@ class VectorStore:
                     "metadata": metadata,
                 })
         else:
-            # Fallback: cosine similarity using pseudo-random embeddings
-            def matches_filter(meta: Dict | None) -> bool:
-                if not where:
-                    return True
-                if not isinstance(meta, dict):
-                    return False
-                for key, value in where.items():
-                    if meta.get(key) != value:
-                        return False
-                return True
-
-            def emb(s):
-                import random
-                random.seed(hash(s) & 0xffffffff)
-                return [random.random() for _ in range(64)]
-
-            def cos(a, b):
-                num = sum(x * y for x, y in zip(a, b))
-                da = sqrt(sum(x * x for x in a))
-                db = sqrt(sum(x * x for x in b))
-                return num / (da * db + 1e-9)
-
-            q = emb(query)
-            scored = []
-            for i, t in enumerate(self.docs):
-                metadata = self.meta[i] if i < len(self.meta) else {}
-                if not matches_filter(metadata):
-                    continue
-                scored.append((i, cos(q, emb(t))))
-            scored.sort(key=lambda x: x[1], reverse=True)
-
-            for i, s in scored[:top_k]:
-                metadata = self.meta[i] if i < len(self.meta) else {}
-                out.append({
-                    "chunk": self.docs[i],
-                    "score": float(s),
-                    "doc_id": metadata.get("doc_id", str(i)),
-                    "metadata": metadata,
-                })
+            # Fallback: cosine top-k over the in-memory embedding matrix
+            with self._lock:
+                mask = self._filter_mask(where) if where else None
+                idx, scores = self._vectors.topk(q_vec, top_k, mask=mask)
+
+                for i, s in zip(idx, scores):
+                    metadata = self.meta[i] if i < len(self.meta) else {}
+                    out.append({
+                        "chunk": self.docs[i],
+                        "score": float(s),
+                        "doc_id": metadata.get("doc_id", str(i)),
+                        "metadata": metadata,
+                    })
         return out
 
     # =====================================================
@@ -210,15 +282,24 @@ class VectorStore:
             self.coll.delete(where={"doc_id": doc_id})
             return True
 
-        if not getattr(self, "docs", None):
+        with self._lock:
+            return self._delete_document_locked(doc_id)
+
+    def _delete_document_locked(self, doc_id: str) -> bool:
+        """Fallback delete_document body; the caller holds self._lock."""
+        if not self.docs:
             return False
 
         kept_docs: list[str] = []
         kept_meta: list[dict] = []
         removed = False
 
+        keep_mask: list[bool] = []
+
         for text, meta in zip(self.docs, self.meta):
-            if isinstance(meta, dict) and meta.get("doc_id") == doc_id:
+            keep = not (isinstance(meta, dict) and meta.get("doc_id") == doc_id)
+            keep_mask.append(keep)
+            if not keep:
                 removed = True
                 continue
             kept_docs.append(text)
@@ -227,6 +308,9 @@ class VectorStore:
         if removed:
             self.docs = kept_docs
             self.meta = kept_meta
+            self._vectors.keep(keep_mask)
+            self._postings = {}  # row indices shifted
+            self._index_meta()
 
         return removed
 
@@ -243,8 +327,11 @@ class VectorStore:
             if ids:
                 self.coll.delete(ids=ids)
         else:
-            self.docs = []
-            self.meta = []
+            with self._lock:
+                self.docs = []
+                self.meta = []
+                self._vectors.clear()
+                self._postings = {}
 
 
 
@@ -1,4 +1,4 @@
-from typing import Dict, Any
+from typing import Callable, Dict, Any
 
 from app.agent.memory import LongTermMemoryStore
 
@@ -51,8 +51,8 @@ class ConversationMemoryAdapter:
         "required": ["user_id", "session_id"],
     }
 
-    def __init__(self, longterm_mem: LongTermMemoryStore):
-        self.longterm_mem = longterm_mem
+    def __init__(self, get_longterm_mem: Callable[[], LongTermMemoryStore]):
+        self._get_longterm_mem = get_longterm_mem  # resolved per call so the store can be built lazily
 
     def run(
         self,
@@ -61,7 +61,7 @@ class ConversationMemoryAdapter:
         query: str = "",
         top_k: int = 5,
     ) -> Dict[str, Any]:
-        results = self.longterm_mem.search(
+        results = self._get_longterm_mem().search(
             query,
             top_k=top_k,
             user_id=user_id,
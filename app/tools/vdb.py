@@ -39,6 +39,10 @@ class KnowledgeBaseStore:
         """Search the knowledge base for relevant information."""
         return self.vstore.query(query, top_k)
 
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts with the knowledge base embedding model."""
+        return self.vstore.embed(texts)
+
     def list_documents(self) -> List[Dict[str, Any]]:
         """Return all documents stored in the knowledge base."""
         return self.vstore.list_documents()
@@ -258,6 +262,10 @@ class VDBAdapter:
         """
         return self.store.search(query, top_k)
 
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts with the same model used for knowledge retrieval."""
+        return self.store.embed(texts)
+
     def list_documents(self) -> List[Dict[str, Any]]:
         """List all documents stored in the vector database."""
         return self.store.list_documents()
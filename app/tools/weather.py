@@ -7,6 +7,7 @@ import time
 from datetime import datetime, timedelta
 from typing import Optional, Dict, Any
 from app.utils.config import settings
+from app.utils.http import get_session
 
 
 class WeatherAdapter:
@@ -47,6 +48,10 @@ class WeatherAdapter:
         "required": ["location"]
     }
     
+    def __init__(self, http: Optional[requests.Session] = None):
+        # Pooled session shared with other adapters unless one is injected
+        self.http = http or get_session()
+    
     def run(self, **kwargs) -> Dict[str, Any]:
         """
         Unified entry point for the weather tool.
@@ -127,7 +132,7 @@ class WeatherAdapter:
     def _geocode(self, city: str) -> tuple[float, float]:
         """Convert city name to coordinates."""
         try:
-            response = requests.get(
+            response = self.http.get(
                 "https://geocoding-api.open-meteo.com/v1/search",
                 params={"name": city, "count": 1},
                 timeout=self.TIMEOUT
@@ -148,7 +153,7 @@ class WeatherAdapter:
     
     def _get_current(self, lat: float, lon: float, location: Optional[str]) -> dict:
         """Get current weather."""
-        r = requests.get(
+        r = self.http.get(
             "https://api.open-meteo.com/v1/forecast",
             params={
                 "latitude": lat,
@@ -176,7 +181,7 @@ class WeatherAdapter:
     
     def _get_forecast(self, lat: float, lon: float, location: Optional[str], date: datetime.date) -> dict:
         """Get weather forecast."""
-        r = requests.get(
+        r = self.http.get(
             "https://api.open-meteo.com/v1/forecast",
             params={
                 "latitude": lat,
@@ -222,7 +227,7 @@ class WeatherAdapter:
         """Get historical weather."""
         date_str = date.strftime("%Y-%m-%d")
         
-        r = requests.get(
+        r = self.http.get(
             "https://archive-api.open-meteo.com/v1/archive",
             params={
                 "latitude": lat,
@@ -72,11 +72,20 @@ class Settings(BaseSettings):
     LONGTERM_PATH: str = LONGTERM_PATH
     KNOWLEDGE_BACKEND: str = KNOWLEDGE_BACKEND
     KNOWLEDGE_PATH: str = KNOWLEDGE_PATH
+    # Store in-memory long-term memory vectors as int8 (4x smaller, ~1e-3 cosine error)
+    LONGTERM_INT8_VECTORS: bool = False
+    # HNSW graph parameters for the Chroma long-term memory collection (new collections only)
+    LONGTERM_HNSW_M: int = 32
+    LONGTERM_HNSW_EF_CONSTRUCTION: int = 200
+    LONGTERM_HNSW_EF_SEARCH: int = 64
 
     # LLM Configuration
     LLM_PROVIDER: str = DEFAULT_LLM_PROVIDER  # Options: "mock", "deepseek", "gemini", "openai"
     DEFAULT_MODEL: str = DEFAULT_MODEL
     DEFAULT_TEMPERATURE: float = DEFAULT_TEMPERATURE
+    # Retries of timed-out, rate-limited (429) and 5xx requests, with exponential backoff
+    # (OpenAI-compatible SDK clients)
+    LLM_MAX_RETRIES: int = 2
     
     # DeepSeek
     DEEPSEEK_API_KEY: str | None = None
@@ -92,6 +101,20 @@ class Settings(BaseSettings):
     OPENAI_MODEL: str = "gpt-4o-mini"
     OPENAI_BASE_URL: str | None = None
 
+    # Semantic cache for intent recognition / planning LLM calls
+    SEMANTIC_CACHE_ENABLED: bool = True
+    SEMANTIC_CACHE_SIZE: int = 256
+    SEMANTIC_CACHE_THRESHOLD: float = 0.95
+
+    # Cache for final answers (direct QA / summaries), keyed by user and exact query; TTL in seconds
+    ANSWER_CACHE_ENABLED: bool = True
+    ANSWER_CACHE_SIZE: int = 10000
+    ANSWER_CACHE_THRESHOLD: float = 0.9
+    ANSWER_CACHE_TTL: int = 3600
+    # Whole-turn results (tools + answer) for a repeated query with the same intents and slots
+    # share the answer cache, with a shorter TTL since tool data goes stale
+    RESPONSE_CACHE_TTL: int = 300
+
     class Config:
         env_file = ".env"
         extra = "ignore"
@@ -0,0 +1,86 @@
+"""
+Shared, pooled HTTP clients.
+
+Tool adapters and LLM clients reuse these process-wide clients so keep-alive
+connections survive across tool calls and turns instead of paying a TCP/TLS
+handshake per request. Both are closed at interpreter exit.
+"""
+from __future__ import annotations
+
+import atexit
+import threading
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import httpx
+    _HAVE_HTTPX = True
+except Exception:
+    _HAVE_HTTPX = False
+
+try:
+    import h2  # noqa: F401  -- lets httpx multiplex concurrent requests over one HTTP/2 connection
+    _HAVE_H2 = True
+except Exception:
+    _HAVE_H2 = False
+
+MAX_CONNECTIONS = 64
+MAX_KEEPALIVE_CONNECTIONS = 32
+KEEPALIVE_EXPIRY = 60.0  # seconds an idle connection stays open (covers gaps between chat turns)
+
+_lock = threading.Lock()
+_session: Optional[requests.Session] = None
+_httpx_client = None
+
+
+def get_session() -> requests.Session:
+    """Return the shared requests.Session (created on first use)."""
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=8, pool_maxsize=MAX_CONNECTIONS)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+def get_httpx_client():
+    """
+    Return the shared httpx.Client for SDKs that accept one, or None if httpx is missing.
+
+    The client speaks HTTP/2 when the optional h2 package is installed, else HTTP/1.1.
+    """
+    global _httpx_client
+    if not _HAVE_HTTPX:
+        return None
+    if _httpx_client is None:
+        with _lock:
+            if _httpx_client is None:
+                _httpx_client = httpx.Client(
+                    http2=_HAVE_H2,
+                    limits=httpx.Limits(
+                        max_connections=MAX_CONNECTIONS,
+                        max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                        keepalive_expiry=KEEPALIVE_EXPIRY,
+                    ),
+                    timeout=httpx.Timeout(60.0, connect=10.0),
+                )
+    return _httpx_client
+
+
+@atexit.register
+def close_clients() -> None:
+    """Close the shared clients (safe to call more than once)."""
+    global _session, _httpx_client
+    with _lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+        if _httpx_client is not None:
+            _httpx_client.close()
+            _httpx_client = None
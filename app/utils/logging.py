@@ -9,12 +9,20 @@ EMAIL_RE = re.compile(r"([A-Za-z0-9._%+-]+)@([A-Za-z0-9.-]+)\.[A-Za-z]{2,}")
 TOKEN_RE = re.compile(r"(Bearer\s+)?([A-Za-z0-9-_]{20,})")
 
 class MaskPIIFilter(logging.Filter):
-    """Filter to mask PII (emails, tokens) in log messages."""
+    """
+    Filter to mask PII (emails, tokens) in log messages.
+
+    %-style arguments are merged into the message first, so PII passed as an
+    argument is masked too; that formatting only happens for records a
+    handler actually emits.
+    """
     def filter(self, record: logging.LogRecord) -> bool:
         if isinstance(record.msg, str):
-            msg = EMAIL_RE.sub(lambda m: f"{m.group(1)[:2]}***@***", record.msg)
+            msg = record.getMessage() if record.args else record.msg
+            msg = EMAIL_RE.sub(lambda m: f"{m.group(1)[:2]}***@***", msg)
             msg = TOKEN_RE.sub("***TOKEN***", msg)
             record.msg = msg
+            record.args = None
         return True
 
 def configure_logging():
@@ -0,0 +1,41 @@
+"""
+JSON helpers used on the agent hot paths.
+
+Uses orjson (C extension) when installed and falls back to the stdlib json
+module otherwise. Both return/accept `str` so callers never see bytes.
+"""
+from __future__ import annotations
+
+import json
+from typing import Any
+
+try:
+    import orjson
+    _HAVE_ORJSON = True
+except Exception:
+    _HAVE_ORJSON = False
+
+# orjson.JSONDecodeError subclasses json.JSONDecodeError, so one name covers both
+JSONDecodeError = json.JSONDecodeError
+
+
+def dumps(obj: Any, indent: bool = False, sort_keys: bool = False) -> str:
+    """Serialize obj to a JSON string (non-ASCII kept as-is, unknown types via str())."""
+    if _HAVE_ORJSON:
+        option = orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=str, option=option).decode("utf-8")
+    if indent:
+        return json.dumps(obj, ensure_ascii=False, default=str, indent=2, sort_keys=sort_keys)
+    # Match orjson's compact output so stored payloads are the same size either way
+    return json.dumps(obj, ensure_ascii=False, default=str, separators=(",", ":"), sort_keys=sort_keys)
+
+
+def loads(data: str | bytes) -> Any:
+    """Parse a JSON document from str or bytes."""
+    if _HAVE_ORJSON:
+        return orjson.loads(data)
+    return json.loads(data)
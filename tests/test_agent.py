@@ -2,10 +2,18 @@
 Behavioral tests for Agent Core.
 Tests the structured multi-turn Agent with intent recognition, ReAct planning, and HITL clarification.
 """
+import asyncio
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
 import pytest
 from unittest.mock import Mock, patch, MagicMock
+from app.agent import core
 from app.agent.core import Agent
 from app.agent.intent import Intent
+from app.agent.planning import Step
 
 
 class TestAgentBehavior:
@@ -14,6 +22,18 @@ class TestAgentBehavior:
     def setup_method(self):
         """Set up test fixtures before each test method."""
         self.agent = Agent(max_rounds=6)
+
+    def teardown_method(self):
+        """Shut down the agent's worker pools."""
+        self.agent.close()
+
+    def _recognized(self, *intents):
+        """Patch intent recognition to return the given intents."""
+        return patch.object(self.agent, "_recognize_intents", return_value=list(intents))
+
+    def _tool_returns(self, name, observation):
+        """Patch a registered tool's run() to return a fixed observation."""
+        return patch.object(self.agent.tools.tools[name], "run", return_value=observation)
     
     def test_weather_query_returns_answer(self):
         """
@@ -199,6 +219,433 @@ class TestAgentBehavior:
         
         print(f"✓ Test passed: Session memory persists context")
 
+    def test_ahandle_runs_pipeline_off_event_loop(self):
+        """
+        Test 5: Async entry point returns the same structured result as handle().
+        """
+        result = asyncio.run(self.agent.ahandle("test_user_async", "Tell me about federated learning"))
+
+        assert result is not None
+        assert result["type"] in ["answer", "clarification"]
+        assert "answer" in result or "message" in result
+
+    def test_concurrent_secure_turns_unmask_their_own_pii(self):
+        """
+        Test 6: Concurrent secure-mode turns each restore only the placeholders issued for them.
+        """
+        def plan_and_execute(user_id, query, *args, **kwargs):
+            time.sleep(0.05)  # keep both turns in flight at once
+            return {"type": "answer", "answer": f"You said: {query}", "intents": [], "steps": []}
+
+        async def both():
+            return await asyncio.gather(
+                self.agent.ahandle("alice", "remember alice@example.com", "s_alice", secure_mode=True),
+                self.agent.ahandle("bob", "remember bob@example.com", "s_bob", secure_mode=True),
+            )
+
+        with self._recognized(Intent("general_qa", {}, 0.9)), \
+             patch.object(self.agent, "_plan_and_execute", side_effect=plan_and_execute):
+            alice, bob = asyncio.run(both())
+
+        assert "a***@example.com" in alice["answer"] and "b***@" not in alice["answer"]
+        assert "b***@example.com" in bob["answer"] and "a***@" not in bob["answer"]
+
+    def test_multiple_intents_merge_in_order(self):
+        """
+        Test 7: Independent intents run concurrently (first on the calling thread) but results keep intent order.
+        """
+        threads = {}
+        run_intent = self.agent._run_intent
+
+        def record_thread(user_id, user_query, intent, *args):
+            threads[intent.name] = threading.current_thread()
+            return run_intent(user_id, user_query, intent, *args)
+
+        with patch.object(self.agent, "_run_intent", side_effect=record_thread), self._recognized(
+            Intent("get_weather", {"location": "Tokyo"}, 0.9),
+            Intent("summarize_emails", {"count": 2}, 0.9),
+        ), self._tool_returns("weather", {"location": "Tokyo", "temperature": 20, "condition": "Clear"}), \
+             self._tool_returns("gmail", {"summary": "2 emails", "count": 2, "emails": []}):
+            result = self.agent.handle("test_user_multi", "Weather in Tokyo and my last 2 emails")
+
+        assert result["type"] == "answer"
+        assert [step["intent"] for step in result["steps"]] == ["get_weather", "summarize_emails"]
+        assert [tool["name"] for tool in result["used_tools"]] == ["weather", "gmail"]
+        # steps and trace share the same serialized rows
+        assert result["steps"][0] is result["trace"]["steps"][0]
+        assert threads["get_weather"] is threading.current_thread()
+        assert threads["summarize_emails"] is not threading.current_thread()
+
+    def test_slot_complete_intent_skips_llm_planning(self):
+        """
+        Test 8: A single-tool intent with all required slots runs its tool without a planning LLM call.
+        """
+        with self._recognized(Intent("get_weather", {"location": "Oslo"}, 0.9)), \
+             patch.object(self.agent, "_plan_next_step") as mock_plan, \
+             self._tool_returns("weather", {"location": "Oslo", "temperature": 3, "condition": "Snow"}) as mock_weather:
+            result = self.agent.handle("test_user_direct", "Weather in Oslo")
+
+        mock_plan.assert_not_called()
+        mock_weather.assert_called_once_with(location="Oslo")
+        assert result["type"] == "answer"
+
+    def test_longterm_memory_written_in_background(self):
+        """
+        Test 9: Long-term memory inserts are queued off the response path and can be awaited.
+        """
+        user_id, session_id = "test_user_bg", f"test_session_bg_{uuid.uuid4().hex}"
+        result = self.agent.handle(user_id, "Tell me about federated learning", session_id)
+        assert result["type"] in ["answer", "clarification"]
+
+        self.agent.wait_for_persistence(timeout=5)
+        hits = self.agent.longterm_mem.search("Tell me about federated learning", user_id=user_id, session_id=session_id)
+        assert any("federated learning" in hit["chunk"] for hit in hits)
+
+    def test_longterm_memory_keeps_saving_after_short_term_is_full(self):
+        """
+        Test 10: Turns past the short-term buffer limit still reach long-term memory.
+        """
+        user_id, session_id = "test_user_full", f"test_session_full_{uuid.uuid4().hex}"
+        for i in range(self.agent.short_mem.limit + 2):
+            self.agent.handle(user_id, f"Tell me about topic number {i}", session_id)
+
+        self.agent.wait_for_persistence(timeout=5)
+        last = f"Tell me about topic number {self.agent.short_mem.limit + 1}"
+        hits = self.agent.longterm_mem.search(last, top_k=20, user_id=user_id, session_id=session_id)
+        assert any(hit["chunk"] == last for hit in hits)
+
+    def test_query_embedded_once_per_turn(self):
+        """
+        Test 11: Intent cache, planning cache and answer cache share one query embedding.
+        """
+        calls = []
+        embed = self.agent._embed_fn
+        self.agent._embed_fn = lambda texts: calls.append(list(texts)) or embed(texts)
+
+        self.agent.handle("test_user_embed", "Tell me about federated learning", "test_session_embed")
+
+        assert calls == [["Tell me about federated learning"]]
+        assert len(self.agent.llm_cache) > 0
+
+    def test_answer_cache_ignores_near_miss_queries(self):
+        """
+        Test 12: Cached answers are reused for the same user's exact query, never for one that differs in a number.
+        """
+        with patch.object(self.agent.llm, "chat", side_effect=lambda messages, **kwargs: f"answer {len(messages)}") as mock_chat:
+            self.agent._direct_llm_qa("What is 15 percent of 80 dollars?", [], user_id="alice")
+            self.agent._direct_llm_qa("What is 15 percent of 90 dollars?", [], user_id="alice")
+            self.agent._direct_llm_qa("What is 15 percent of 80 dollars?", [], user_id="bob")
+            self.agent._direct_llm_qa("What is 15 percent  of 80 dollars?", [], user_id="alice")
+
+        assert mock_chat.call_count == 3
+
+    def test_turn_finishing_after_close_skips_longterm_write(self):
+        """
+        Test 13: A turn committed after close() still updates session memory but skips long-term persistence.
+        """
+        self.agent.close()
+        self.agent._commit_turn("test_user_closed", "s_closed", "hello there", "hi", [], [], {})
+
+        context = self.agent.session_mem.read("test_user_closed", "s_closed", "context")
+        assert context
+
+    def test_intent_cache_reuses_slots_only_for_the_same_user_and_text(self):
+        """
+        Test 14: Cached intents (and their slots) are reused for the exact query of the same user only.
+        """
+        recognize = lambda text, context: [Intent("general_qa", {"query": text}, 0.9)]
+        with patch.object(self.agent.intent_recognizer, "recognize", side_effect=recognize) as mock_recognize:
+            alice = self.agent._recognize_intents("alice", "What is 15 percent of 80 dollars?", [])
+            bob = self.agent._recognize_intents("bob", "What is 15 percent of 90 dollars?", [])
+            alice_again = self.agent._recognize_intents("alice", "What is 15  percent of 80 dollars?", [])
+            bob_same_text = self.agent._recognize_intents("bob", "What is 15 percent of 80 dollars?", [])
+
+        assert mock_recognize.call_count == 3
+        assert bob[0].slots == {"query": "What is 15 percent of 90 dollars?"}
+        assert alice_again[0].slots == alice[0].slots
+        assert bob_same_text[0] is not alice[0]
+
+    def test_planner_prompt_tracks_tool_registry(self):
+        """
+        Test 15: The planner system prompt is serialized at construction and refreshed when tools change.
+        """
+        version, prompt = self.agent._planner_prompt
+        assert version == self.agent.tools.version and prompt
+        assert self.agent._planner_system_prompt() is prompt
+
+        self.agent.tools.register("calculator", Mock(description="Evaluate arithmetic", parameters=None))
+        refreshed = self.agent._planner_system_prompt()
+        assert "calculator" in refreshed and "calculator" not in prompt
+
+    def test_summary_streams_through_on_token(self):
+        """
+        Test 16: on_token receives the final summary in chunks that join to the returned answer.
+        """
+        chunks = []
+        with self._recognized(Intent("get_weather", {"location": "Lima"}, 0.9)), \
+             self._tool_returns("weather", {"location": "Lima", "temperature": 18, "condition": "Overcast"}):
+            result = self.agent.handle("test_user_stream", "Weather in Lima", on_token=chunks.append)
+
+        assert result["type"] == "answer"
+        assert len(chunks) > 1
+        assert "".join(chunks) == result["answer"]
+
+    def test_prompt_context_is_budgeted(self):
+        """
+        Test 17: Direct-QA context keeps the newest messages within the character budget.
+        """
+        context = [{"role": "user", "content": str(i) * 900} for i in range(8)]
+        kept = core._budget_context(context)
+
+        assert [m["content"][0] for m in kept] == ["5", "6", "7"]
+        assert kept[1] is context[6] and kept[2] is context[7]
+        assert kept[0]["content"] == "5" * 200 + "…"
+        assert core._truncate("abc", 5) == "abc"
+
+    def test_greeting_bypasses_intent_recognition(self):
+        """
+        Test 18: Greetings and acknowledgements get a canned reply without intent recognition.
+        """
+        pending = '{"clarification_type": "tool_failed", "original_query": "Weather in Oslo"}'
+        self.agent.session_mem.write("test_user_chat", "s_chat", "pending_context", pending)
+        with patch.object(self.agent, "_recognize_intents") as mock_recognize:
+            hello = self.agent.handle("test_user_chat", "Hi!", "s_chat")
+            thanks = self.agent.handle("test_user_chat", "thank you", "s_chat")
+
+        mock_recognize.assert_not_called()
+        assert hello["type"] == "answer" and hello["answer"].startswith("Hello")
+        assert thanks["answer"].startswith("You're welcome")
+        assert self.agent.chit_chat_bypassed == 2
+        assert self.agent.short_mem.get_context()[-2]["content"] == "thank you"
+        # a pending clarification survives the bypass
+        assert self.agent.session_mem.read("test_user_chat", "s_chat", "pending_context") == pending
+        # empty or punctuation-only input is not a greeting
+        assert not any(core._CHIT_CHAT_RE.fullmatch(t) for t in ("", "  ", "?!", "..."))
+
+    def test_heavy_stores_built_on_first_use(self):
+        """
+        Test 19: Long-term memory is built on first use, exactly once.
+        """
+        assert "longterm_mem" not in self.agent.__dict__
+
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            stores = list(pool.map(lambda _: self.agent.longterm_mem, range(8)))
+        assert all(s is stores[0] for s in stores)
+
+        recalled = self.agent.tools.tools["memory"].run(user_id="lazy_user", session_id="lazy_session", query="hi")
+        assert recalled["results"] == []
+        assert self.agent.longterm_mem is stores[0]
+
+    def test_extract_plan_handles_fenced_and_bare_json(self):
+        """
+        Test 20: Planning JSON is taken from a ```json fence or a bare JSON reply, not from echoed prose.
+        """
+        fenced = 'Plan:\n```json\n{"thought": "t", "action": "weather", "input": {"city": "Oslo"}}\n```\nDone.'
+        bare = '{"thought": "t", "action": null, "decide_next": false}'
+
+        assert self.agent._extract_plan(fenced)["input"] == {"city": "Oslo"}
+        assert self.agent._extract_plan(bare)["decide_next"] is False
+        assert self.agent._extract_plan("no plan here") is None
+        assert self.agent._extract_plan('(mocked-llm) Slots: {"location": "Oslo"}') is None
+
+    def test_recall_search_overlaps_intent_recognition(self):
+        """
+        Test 21: A recall-like query searches long-term memory while its intents are recognized, once.
+        """
+        searched = threading.Event()
+        memories = [{"text": "my favourite city is Kyoto", "metadata": {"role": "user"}}]
+
+        def search(*args, **kwargs):
+            searched.set()
+            return memories
+
+        def recognize(user_id, text, context):
+            assert searched.wait(5)  # the search started before recognition finished
+            return [Intent("recall_conversation", {"query": text}, 0.9)]
+
+        with patch.object(self.agent.longterm_mem, "search", side_effect=search) as mock_search, \
+             patch.object(self.agent, "_recognize_intents", side_effect=recognize), \
+             self._tool_returns("memory", {"results": memories}):
+            result = self.agent.handle("test_user_recall", "What did I ask last time?", "s_recall")
+
+        assert result["type"] == "answer"
+        mock_search.assert_called_once()
+        assert not core._RECALL_CUE_RE.search("Weather in Tokyo")
+
+    def test_repeated_turn_reuses_cached_result(self):
+        """
+        Test 22: Repeating a query with the same intents reuses the turn result for that user only.
+        """
+        weather = Intent("get_weather", {"location": "Tokyo"}, 0.9)
+        emails = Intent("summarize_emails", {"count": 2}, 0.9)
+        with patch.object(self.agent, "_enhance_query_with_context", side_effect=lambda text, *_: text):
+            with self._recognized(weather), \
+                 self._tool_returns("weather", {"location": "Tokyo", "temperature": 20, "condition": "Clear"}) as run:
+                first = self.agent.handle("test_user_repeat", "Weather in Tokyo?")
+                again = self.agent.handle("test_user_repeat", "Weather  in Tokyo?")
+                other = self.agent.handle("test_user_repeat_2", "Weather in Tokyo?")
+            assert run.call_count == 2
+            assert again["answer"] == first["answer"] and again is not first
+            assert other["answer"] == first["answer"]
+
+            with self._recognized(emails), \
+                 self._tool_returns("gmail", {"summary": "2 emails", "count": 2, "emails": []}) as run:
+                self.agent.handle("test_user_repeat", "My last 2 emails")
+                self.agent.handle("test_user_repeat", "My last 2 emails")
+            assert run.call_count == 2  # mailbox turns are never reused
+
+    def test_observation_snippets_are_single_line_and_capped(self):
+        """
+        Test 23: Knowledge and recall observations show each result on one line, cut at 200 characters.
+        """
+        long_chunk = "  line one\nline two " + "x" * 400
+        hits = self.agent._format_observation({"results": [{"chunk": long_chunk, "metadata": {"title": "Doc"}}, "plain"]})
+        recall = self.agent._format_observation({"scope": "longterm", "results": [{"text": "a\nb"}]})
+        record = self.agent._format_observation({"results": [{"id": 7, "kind": "row", "score": 1, "blob": "y" * 10000}]})
+
+        first, second = hits.split("\n")[1:]
+        assert first.startswith("1. Doc: line one line two x") and first.endswith("x...")
+        assert len(first) == len("1. Doc: ") + 200 + 3
+        assert second == "2. plain"
+        assert recall == "Conversation recall:\n1. a b"
+        assert "blob" not in record and "id" in record  # only the leading fields are serialized
+
+    def test_independent_tool_calls_run_concurrently(self):
+        """
+        Test 24: A plan listing independent "actions" invokes each tool in parallel and records them in plan order.
+        """
+        plan = (
+            '{"thought": "both", "action": null, "decide_next": false, "actions": ['
+            '{"action": "gmail", "input": {"count": 3}}, {"action": "weather", "input": {"location": "Tokyo"}}]}'
+        )
+        threads = {}
+
+        def record(name, observation):
+            def run(**kwargs):
+                threads[name] = threading.current_thread()
+                return observation
+            return run
+
+        with self._recognized(Intent("get_weather", {}, 0.9)), \
+             patch.object(self.agent.llm, "chat_json", return_value=plan), \
+             patch.object(self.agent.tools.tools["gmail"], "run", side_effect=record("gmail", {"summary": "3 emails"})), \
+             patch.object(self.agent.tools.tools["weather"], "run", side_effect=record("weather", {"temperature": 20})):
+            result = self.agent.handle("test_user_batch", "Tokyo weather and my last 3 emails")
+
+        assert result["type"] == "answer"
+        assert [tool["name"] for tool in result["used_tools"]] == ["gmail", "weather"]
+        assert [step["status"] for step in result["steps"]] == ["succeeded", "succeeded"]
+        assert threads["gmail"] is threading.current_thread()
+        assert threads["weather"].name.startswith("tool")
+
+    def test_structured_queries_skip_llm_intent_recognition(self):
+        """
+        Test 25: Explicit notes and "weather in <Place>" questions are recognized without the LLM.
+        """
+        recognize = self.agent._recognize_intents
+        with patch.object(self.agent.intent_recognizer, "recognize", return_value=[]) as mock_recognize:
+            note = recognize("test_user_fast", "Remember that my flight is at 9am", [])
+            weather = recognize("test_user_fast", "What's the weather in New York?", [])
+            mock_recognize.assert_not_called()
+
+            recognize("test_user_fast", "Remember what I asked last time?", [])
+            recognize("test_user_fast", "Remember that restaurant I mentioned?", [])
+            recognize("test_user_fast", "What's the weather in Tokyo tomorrow?", [])
+            recognize("test_user_fast", "weather in Paris Today", [])
+            recognize("test_user_fast", "weather in June", [])
+            assert mock_recognize.call_count == 5
+
+        assert [(i.name, i.slots) for i in note] == [("note_down", {"text": "my flight is at 9am"})]
+        assert [(i.name, i.slots) for i in weather] == [("get_weather", {"location": "New York"})]
+
+    def test_citation_block_lists_each_source_once_in_order(self):
+        """
+        Test 26: Repeated (file, page) citations are listed once, in first-seen order.
+        """
+        citations = [
+            {"filename": "b.pdf", "page": 2},
+            {"filename": "a.pdf", "page": None},
+            {"filename": "b.pdf", "page": 2},
+            {"filename": None, "page": 1},
+        ]
+        answer = self.agent._append_citation_block("Answer. ", citations)
+
+        assert answer == "Answer.\n\nSource:\n1. b.pdf, page 2\n2. a.pdf, page ?"
+        assert self.agent._append_citation_block("Answer.", []) == "Answer."
+
+    def test_recalled_memories_share_the_qa_context_budget(self):
+        """
+        Test 27: Each merged long-term memory is capped, so all recalled memories reach direct QA.
+        """
+        memories = [{"chunk": f"memory {i} " + "z" * 5000} for i in range(3)]
+        merged = self.agent._merge_context([{"role": "user", "content": "hi"}], memories)
+        budgeted = core._budget_context(merged)
+
+        assert merged[0] == {"role": "user", "content": "hi"}
+        assert all(f"memory {i}" in budgeted[-1]["content"] for i in range(3))
+
+    def test_direct_qa_sends_a_single_system_message(self):
+        """
+        Test 28: Recalled memory is folded into the direct-QA system message after its fixed instructions.
+        """
+        context = self.agent._merge_context(
+            [{"role": "user", "content": "I live in Oslo"}, {"role": "assistant", "content": "Noted."}],
+            [{"chunk": "user lives in Oslo"}],
+        )
+        with patch.object(self.agent.llm, "chat", return_value="Oslo") as mock_chat:
+            self.agent._direct_llm_qa("Where do I live?", context, user_id="test_user_qa", use_cache=False)
+
+        messages = mock_chat.call_args[0][0]
+        assert [m["role"] for m in messages] == ["system", "user", "assistant", "user"]
+        assert messages[0]["content"].startswith("You are a helpful assistant")
+        assert messages[0]["content"].endswith("Previous memory: user lives in Oslo")
+
+    def test_single_direct_answer_streams_and_is_not_summarized_again(self):
+        """
+        Test 29: A turn whose only observation is a direct-QA answer streams it, with no summary LLM call.
+        """
+        tokens = []
+        last_step = Step(intent="general_qa", thought="answer directly", decide_next=False)
+        with self._recognized(Intent("general_qa", {"query": "What is 6 times 7?"}, 0.9)), \
+             patch.object(self.agent, "_plan_next_step", return_value=last_step), \
+             patch.object(self.agent.llm, "chat_stream", side_effect=lambda *args, **kwargs: iter(["4", "2"])) as mock_stream:
+            result = self.agent.handle("test_user_single", "What is 6 times 7?", on_token=tokens.append)
+
+        assert result["answer"] == "42"
+        assert tokens == ["4", "2"]
+        mock_stream.assert_called_once()  # the QA call; no summary call follows
+
+    def test_duplicate_memories_are_merged_once(self):
+        """
+        Test 30: Long-term memories that differ only in case or whitespace are merged into the context once.
+        """
+        memories = [{"chunk": "I live in Oslo"}, {"chunk": "i live  in oslo "}, {"chunk": "I work at NTNU"}, {"chunk": ""}]
+        merged = self.agent._merge_context([], memories)
+
+        assert merged[-1]["content"] == " Previous memory: I live in Oslo\n Previous memory: I work at NTNU"
+        assert self.agent._merge_context([], [{"chunk": ""}]) == []
+
+    def test_turn_cache_holds_only_context_free_tool_turns(self):
+        """
+        Test 31: Context-dependent QA turns are never served from the turn cache, and cached turns are copies.
+        """
+        qa = Intent("general_qa", {"query": "And what about the second one?"}, 0.9)
+        assert self.agent._response_key("test_user_ctx", "And what about the second one?", [qa]) is None
+
+        weather = Intent("get_weather", {"location": "Lima"}, 0.9)
+        with patch.object(self.agent, "_enhance_query_with_context", side_effect=lambda text, *_: text), \
+             self._recognized(weather), \
+             self._tool_returns("weather", {"location": "Lima", "temperature": 18, "condition": "Fog"}) as run:
+            first = self.agent.handle("test_user_ctx", "Weather in Lima?", "s_ctx_1")
+            first["used_tools"].clear()
+            again = self.agent.handle("test_user_ctx", "Weather in Lima?", "s_ctx_2")
+            again["steps"].clear()
+            third = self.agent.handle("test_user_ctx", "Weather in Lima?", "s_ctx_2")
+
+        run.assert_called_once()
+        assert [tool["name"] for tool in again["used_tools"]] == ["weather"]
+        assert [step["action"] for step in third["steps"]] == ["weather"]
+
 
 # Legacy test for FastAPI endpoint
 def test_invoke_echo():
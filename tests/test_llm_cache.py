@@ -0,0 +1,137 @@
+from app.llm.cache import SemanticLLMCache, prompt_hash
+
+
+def _embed(texts):
+    table = {
+        "weather in singapore": [1.0, 0.0, 0.0],
+        "weather in singapore?": [0.99, 0.05, 0.0],
+        "summarize my emails": [0.0, 1.0, 0.0],
+    }
+    return [table.get(t, [0.0, 0.0, 1.0]) for t in texts]
+
+
+def test_semantic_hit_requires_matching_prompt_hash():
+    cache = SemanticLLMCache(_embed, capacity=4, threshold=0.95)
+    key = prompt_hash("intent", "[]")
+    cache.store("weather in singapore", key, ["get_weather"])
+
+    assert cache.lookup("weather in singapore?", key) == ["get_weather"]
+    assert cache.lookup("weather in singapore?", prompt_hash("intent", "other")) is None
+    assert cache.lookup("summarize my emails", key) is None
+    assert cache.hits == 1 and cache.misses == 2
+
+
+def test_lru_eviction_keeps_capacity():
+    cache = SemanticLLMCache(_embed, capacity=2, threshold=0.95)
+    key = prompt_hash("plan")
+    cache.store("weather in singapore", key, "a")
+    cache.store("summarize my emails", key, "b")
+    assert cache.lookup("weather in singapore", key) == "a"  # refresh "a"
+    cache.store("something else", key, "c")  # evicts "b"
+
+    assert len(cache) == 2
+    assert cache.lookup("summarize my emails", key) is None
+    assert cache.lookup("weather in singapore", key) == "a"
+    assert cache.lookup("something else", key) == "c"
+
+
+def test_expired_entries_do_not_match():
+    cache = SemanticLLMCache(_embed, capacity=4, threshold=0.9, ttl=60)
+    key = prompt_hash("qa", "user-1")
+    cache.store("weather in singapore", key, "sunny")
+    cache.store("summarize my emails", key, "2 new emails", ttl=-1)  # already expired
+
+    assert cache.lookup("weather in singapore?", key) == "sunny"
+    assert cache.lookup("summarize my emails", key) is None
+    assert cache.lookup("weather in singapore", prompt_hash("qa", "user-2")) is None
+
+
+def test_identical_concurrent_chats_share_one_backend_call():
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    from app.llm.provider import LLMProvider
+
+    llm = LLMProvider()
+    calls = []
+    started = threading.Event()
+    both_entered = threading.Event()
+
+    def gated_dispatch(messages, prompt_cache_key=None):
+        calls.append(messages)
+        (pending,) = llm._inflight.values()
+        wait_for_leader = pending.result
+
+        def follower_result(timeout=None):
+            both_entered.set()  # the second caller is now waiting on this call
+            return wait_for_leader(timeout)
+
+        pending.result = follower_result
+        started.set()
+        assert both_entered.wait(5), "second caller never joined the in-flight call"
+        return "answer"
+
+    llm._dispatch = gated_dispatch
+    messages = [{"role": "user", "content": "weather in singapore"}]
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        first = pool.submit(llm.chat, messages)
+        assert started.wait(5)
+        second = pool.submit(llm.chat, messages)
+        assert first.result() == second.result() == "answer"
+
+    assert len(calls) == 1 and llm.coalesced == 1
+
+
+def test_prompt_cache_key_is_sent_to_openai_only():
+    from unittest.mock import MagicMock
+    from app.llm.provider import LLMProvider
+
+    llm = LLMProvider()
+    llm._client = MagicMock()
+    llm._client.chat.completions.create.return_value.choices[0].message.content = "ok"
+    messages = [{"role": "system", "content": "tools"}, {"role": "user", "content": "hi"}]
+
+    llm.provider = "openai"
+    assert llm.chat(messages, prompt_cache_key="planner-v1") == "ok"
+    _, kwargs = llm._client.chat.completions.create.call_args
+    assert kwargs["extra_body"] == {"prompt_cache_key": "planner-v1"}
+
+    llm.provider = "deepseek"
+    llm.chat(messages, prompt_cache_key="planner-v1")
+    _, kwargs = llm._client.chat.completions.create.call_args
+    assert "extra_body" not in kwargs
+
+
+def test_chat_json_stops_streaming_once_the_object_closes():
+    from app.llm.provider import LLMProvider
+
+    llm = LLMProvider()
+    consumed = []
+
+    def stream(chunks):
+        def chat_stream(messages, prompt_cache_key=None, schema=None):
+            for chunk in chunks:
+                consumed.append(chunk)
+                yield chunk
+        return chat_stream
+
+    llm.chat_stream = stream(['``', '`json\n{"thought": "a } in \\"text\\"",', ' "input": {}}', "\n```", " and more"])
+    assert llm.chat_json([]) == '{"thought": "a } in \\"text\\"", "input": {}}'
+    assert len(consumed) == 3  # the fence and trailing prose were never generated
+
+    llm.chat_stream = stream(["Sure: ", '{"a": 1}', " done"])
+    assert llm.chat_json([]) == 'Sure: {"a": 1} done'  # no leading object: read in full
+
+
+def test_schema_selects_each_backends_json_mode():
+    from app.llm.provider import LLMProvider
+
+    llm = LLMProvider()
+    schema = {"title": "plan_step", "type": "object"}
+
+    llm.provider = "openai"
+    assert llm._openai_extras(schema=schema)["response_format"] == {
+        "type": "json_schema", "json_schema": {"name": "plan_step", "schema": schema},
+    }
+    llm.provider = "deepseek"
+    assert llm._openai_extras("planner-v1", schema) == {"response_format": {"type": "json_object"}}
+    assert llm._openai_extras("planner-v1") == {}
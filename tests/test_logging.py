@@ -0,0 +1,12 @@
+import logging
+
+from app.utils.logging import MaskPIIFilter
+
+
+def test_pii_in_lazy_log_arguments_is_masked():
+    record = logging.LogRecord("agent", logging.INFO, __file__, 1, "Invoking tool '%s' with params: %s", (
+        "gmail", {"to": "alice@example.com"},
+    ), None)
+
+    assert MaskPIIFilter().filter(record)
+    assert record.getMessage() == "Invoking tool 'gmail' with params: {'to': 'al***@***'}"
@@ -0,0 +1,31 @@
+from app.guardrails.security_guard import SecurityGuard
+
+
+def test_every_placeholder_is_unmasked_in_one_pass():
+    guard = SecurityGuard()
+    check = guard.inbound("mail a@b.com or a@b.com from 10.0.0.1")
+    masked, mask_map = check["text"], check["mask_map"]
+    assert masked == "mail [EMAIL_1] or [EMAIL_2] from [IPADDR_3]"
+
+    assert guard.unmask(masked, mask_map) == "mail a@b.com or a@b.com from 10.0.0.1"
+    assert guard.outbound(masked, mask_map)["text"] == "mail a***@b.com or a***@b.com from [REDACTED_IP]"
+
+
+def test_mask_maps_are_scoped_to_their_call():
+    guard = SecurityGuard()
+    alice = guard.inbound("I am alice@example.com")
+    bob = guard.inbound("I am bob@example.com")
+
+    assert alice["text"] == bob["text"] == "I am [EMAIL_1]"
+    assert guard.unmask(alice["text"], alice["mask_map"]) == "I am alice@example.com"
+    assert guard.unmask(bob["text"], bob["mask_map"]) == "I am bob@example.com"
+    assert guard.unmask("[EMAIL_1]", {}) == "[EMAIL_1]"
+
+
+def test_outbound_redacts_each_pii_by_its_type():
+    guard = SecurityGuard()
+    answer = "Reach 12345@mail.com or +65 9123 4567, server 192.168.0.1; again 12345@mail.com"
+
+    assert guard.outbound(answer)["text"] == (
+        "Reach 1***@mail.com or +65 ****67, server [REDACTED_IP]; again 1***@mail.com"
+    )
@@ -0,0 +1,69 @@
+import json
+import sqlite3
+
+import pytest
+
+from app.memory.sqlite_store import SQLiteStore
+from app.agent.memory import SessionMemory
+
+
+def test_wal_mode_enabled(tmp_path):
+    store = SQLiteStore(str(tmp_path / "mem.db"))
+    mode = store._conn.execute("PRAGMA journal_mode").fetchone()[0]
+    assert mode.lower() == "wal"
+    store.close()
+
+
+def test_write_many_writes_and_deletes_in_one_batch(tmp_path):
+    store = SQLiteStore(str(tmp_path / "mem.db"))
+    session = SessionMemory(store)
+    session.write("u1", "s1", "pending_context", '{"clarification_type": "tool_failed"}')
+
+    session.write_many("u1", "s1", {"context": '{"longterm_saved": 2}', "pending_context": None})
+
+    assert session.read("u1", "s1", "context") == '{"longterm_saved": 2}'
+    assert session.read("u1", "s1", "pending_context") is None
+
+    # each write replaces the key's row instead of appending another one
+    session.write("u1", "s1", "context", '{"longterm_saved": 4}')
+    assert SessionMemory(store).read("u1", "s1", "context") == '{"longterm_saved": 4}'
+    count = store._conn.execute("SELECT COUNT(*) FROM memories WHERE type='context'").fetchone()[0]
+    assert count == 1
+    store.close()
+
+
+def test_reads_use_read_only_pool(tmp_path):
+    store = SQLiteStore(str(tmp_path / "mem.db"), readers=2)
+    store.write("u1", "s1", "context", "hello", None)
+
+    assert store.read("u1", "s1")[0]["content"] == "hello"
+    assert store._readers.qsize() == 1  # readers are opened on demand and reused
+    with store._reader() as conn, store._reader() as other:
+        assert conn is not other
+        with pytest.raises(sqlite3.OperationalError):
+            conn.execute("DELETE FROM memories")
+    assert store._readers.qsize() == 2
+    store.close()
+
+
+def test_session_reads_are_served_from_write_through_cache(tmp_path, monkeypatch):
+    store = SQLiteStore(str(tmp_path / "mem.db"))
+    session = SessionMemory(store)
+    context = {"conversation_history": [{"role": "user", "content": "hi"}], "longterm_saved": 2}
+    session.write_many("u1", "s1", {"context": context, "pending_context": None})
+    session.write("u1", "s1", "token", "abc", ttl=60)
+
+    reads = []
+    original_read = store.read
+    monkeypatch.setattr(store, "read", lambda *a, **kw: reads.append(a) or original_read(*a, **kw))
+    assert session.read("u1", "s1", "context") is context
+    assert session.read("u1", "s1", "pending_context") is None
+    assert reads == []
+    assert session.read("u1", "s1", "token") == "abc"  # TTL values always go to SQLite
+    assert len(reads) == 1
+
+    # a fresh instance (e.g. after a restart) loads the JSON written through to SQLite
+    assert json.loads(SessionMemory(store).read("u1", "s1", "context")) == context
+    session.clear("u1", "s1")
+    assert session.read("u1", "s1", "context") is None
+    store.close()
@@ -14,3 +14,127 @@ def test_vdb_query():
     assert r.status_code == 200
     assert "results" in r.json()
 
+
+def test_query_embedding_is_cached(tmp_path):
+    from app.memory.vector_store import VectorStore
+
+    store = VectorStore(path=str(tmp_path), collection="cache_test")
+    first = store.embed_query("secure  aggregation ")
+    second = store.embed_query("secure aggregation")
+    assert first is second
+    info = store.query_cache_info()
+    assert (info.hits, info.misses) == (1, 1)
+
+
+def test_fallback_query_ranks_and_filters(tmp_path, monkeypatch):
+    from app.memory import vector_store
+    from app.memory.vector_store import VectorStore
+
+    monkeypatch.setattr(vector_store, "_HAVE_CHROMA", False)  # exercise the in-memory fallback
+    store = VectorStore(path=str(tmp_path), collection="rank_test")
+    store.ingest([
+        {"text": "secure aggregation", "metadata": {"user_id": "u1", "session_id": "s1"}},
+        {"text": "weather in tokyo", "metadata": {"user_id": "u2", "session_id": "s1"}},
+    ])
+
+    top = store.query("secure aggregation", top_k=1)
+    assert top[0]["chunk"] == "secure aggregation"
+    assert abs(top[0]["score"] - 1.0) < 1e-5
+    ranked = store.query("secure aggregation", top_k=2)
+    assert ranked[0]["score"] >= ranked[1]["score"]  # best first
+
+    scoped = store.query("secure aggregation", top_k=3, where={"$and": [{"user_id": "u2"}, {"session_id": "s1"}]})
+    assert [r["chunk"] for r in scoped] == ["weather in tokyo"]
+
+
+def test_int8_matrix_matches_float_ranking():
+    import numpy as np
+    from app.memory.similarity import EmbeddingMatrix
+
+    rng = np.random.default_rng(0)
+    rows = rng.standard_normal((200, 64)).astype(np.float32)
+    query = rng.standard_normal(64)
+    exact, quantized = EmbeddingMatrix(), EmbeddingMatrix(quantize=True)
+    exact.append(rows)
+    quantized.append(rows)
+
+    idx, scores = exact.topk(query, 5)
+    q_idx, q_scores = quantized.topk(query, 5)
+    assert q_idx == idx
+    assert np.allclose(q_scores, scores, atol=1e-2)
+
+
+def test_fallback_filter_survives_delete(tmp_path, monkeypatch):
+    from app.memory import vector_store
+    from app.memory.vector_store import VectorStore
+
+    monkeypatch.setattr(vector_store, "_HAVE_CHROMA", False)  # exercise the in-memory fallback
+    store = VectorStore(path=str(tmp_path), collection="filter_test")
+    store.ingest([
+        {"text": "alpha", "metadata": {"doc_id": "a", "user_id": "u1"}},
+        {"text": "beta", "metadata": {"doc_id": "b", "user_id": "u2"}},
+        {"text": "gamma", "metadata": {"doc_id": "c", "user_id": "u2", "tags": ["x"]}},
+    ])
+    assert store.delete_document("a")
+
+    assert [r["chunk"] for r in store.query("beta", top_k=3, where={"user_id": "u2"})] == ["beta", "gamma"]
+    assert [r["chunk"] for r in store.query("gamma", top_k=3, where={"tags": ["x"]})] == ["gamma"]
+    assert store.query("alpha", top_k=3, where={"user_id": "u1"}) == []
+
+
+def test_best_keyed_match_only_scores_live_rows_with_key():
+    import numpy as np
+    from app.memory import similarity
+
+    M = np.eye(4, dtype=np.float32)
+    q = np.array([1.0, 0.9, 0.8, 0.0], dtype=np.float32)
+    hashes = np.array([1, 2, 2, 2], dtype=np.uint64)
+    expires = np.array([np.inf, 0.0, np.inf, np.inf])
+
+    assert similarity.best_keyed_match(M, q, hashes, np.uint64(2), expires, 1.0) == (2, np.float32(0.8))
+    assert similarity.best_keyed_match(M, q, hashes, np.uint64(3), expires, 1.0)[0] == -1
+
+
+def test_longterm_store_skips_repeated_messages(monkeypatch):
+    from app.agent.memory import LongTermMemoryStore
+    from app.memory import vector_store
+
+    monkeypatch.setattr(vector_store, "_HAVE_CHROMA", False)  # exercise the in-memory fallback
+    store = LongTermMemoryStore()
+    embedded = []
+    embed = store.vstore.embed
+    monkeypatch.setattr(store.vstore, "embed", lambda texts: embedded.extend(texts) or embed(texts))
+
+    turn = [{"role": "user", "content": "weather in oslo"}, {"role": "assistant", "content": "snow"}]
+    store.store_conversation("u1", "s1", turn)
+    store.store_conversation("u1", "s1", turn, start_index=2)  # e.g. a retried turn
+    store.store_conversation("u1", "s2", turn[:1])
+
+    assert embedded == ["weather in oslo", "snow", "weather in oslo"]
+    assert len(store.vstore.docs) == 3
+
+
+def test_fallback_ingest_keeps_global_rng_and_rows_aligned(tmp_path, monkeypatch):
+    import random
+    from concurrent.futures import ThreadPoolExecutor
+    from app.memory import vector_store
+    from app.memory.vector_store import VectorStore
+
+    monkeypatch.setattr(vector_store, "_HAVE_CHROMA", False)  # exercise the in-memory fallback
+    store = VectorStore(path=str(tmp_path), collection="concurrency_test")
+
+    random.seed(7)
+    expected = random.random()
+    random.seed(7)
+    store.ingest([{"text": "alpha", "metadata": {"user_id": "u1"}}])
+    assert random.random() == expected  # embedding must not reseed the global RNG
+
+    def ingest(i):
+        store.ingest([{"text": f"doc {i}", "metadata": {"user_id": "u1"}}])
+        return store.query("doc", top_k=2, where={"user_id": "u1"})
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(ingest, range(200)))
+
+    assert all(len(r) == 2 for r in results)  # alpha plus at least its own row
+    assert len(store.docs) == len(store.meta) == len(store._vectors) == 201